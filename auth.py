@@ -4,18 +4,20 @@ import hashlib
 import json
 import logging
 import os
+import time
 import webbrowser
 from abc import ABC, abstractmethod
 from enum import Enum
 from typing import Dict, Optional, Tuple, List
 
 import aiofiles
-import aiohttp
 import machineid
 import msal
 import pyperclip
 from cryptography.fernet import Fernet
 
+from utils import HttpClient, http_client as shared_http_client
+
 logger = logging.getLogger('QCL')
 
 class AuthMethod(Enum):
@@ -23,15 +25,20 @@ class AuthMethod(Enum):
     OFFLINE = 2
     THIRD_PARTY = 3
 
+class ReloginRequired(Exception):
+    # 非交互模式下刷新令牌失效：需要用户重新登录，不能在后台弹出设备码登录
+    pass
+
 class IAuthenticator(ABC):
     @abstractmethod
-    async def authenticate(self, refresh_token: Optional[str] = None) -> Dict:
+    async def authenticate(self, refresh_token: Optional[str] = None, interactive: bool = True) -> Dict:
         pass
 
 class MicrosoftAuthenticator(IAuthenticator):
     def __init__(self, client_id: str = "de243363-2e6a-44dc-82cb-ea8d6b5cd98d",
-                 redirect_uri: str = "http://localhost:8080/callback"):
+                 redirect_uri: str = "http://localhost:8080/callback", http_client: Optional[HttpClient] = None):
         self.client_id = client_id
+        self.http_client = http_client or shared_http_client
         self.redirect_uri = redirect_uri
         self.scopes = ["XboxLive.signin"]
         self.xbox_auth_endpoint = "https://user.auth.xboxlive.com/user/authenticate"
@@ -44,9 +51,9 @@ class MicrosoftAuthenticator(IAuthenticator):
             authority="https://login.microsoftonline.com/consumers"
         )
 
-    async def authenticate(self, refresh_token: Optional[str] = None) -> Dict:
+    async def authenticate(self, refresh_token: Optional[str] = None, interactive: bool = True) -> Dict:
         try:
-            microsoft_token = await self._get_microsoft_token(refresh_token)  # 使用MSAL获取Microsoft令牌
+            microsoft_token = await self._get_microsoft_token(refresh_token, interactive)  # 使用MSAL获取Microsoft令牌
             xbl_token, xbl_uhs = await self._authenticate_with_xbox_live(microsoft_token["access_token"])
             xsts_token, xsts_uhs = await self._authenticate_with_xsts(xbl_token)
             minecraft_token = await self._authenticate_with_minecraft(xsts_uhs, xsts_token)
@@ -57,6 +64,8 @@ class MicrosoftAuthenticator(IAuthenticator):
                 "username": profile["name"], "uuid": profile["id"],
                 "access_token": minecraft_token["access_token"],
                 "refresh_token": microsoft_token.get("refresh_token", ""),
+                # Minecraft 访问令牌的过期时间（Unix 时间戳），刷新时据此跳过仍然有效的令牌
+                "expires_at": time.time() + minecraft_token.get("expires_in", 86400),
                 "skins": profile.get("skins", []), "capes": profile.get("capes", [])
             }
             logger.info(f"验证成功: {result['username']} ({result['uuid']})")
@@ -65,7 +74,7 @@ class MicrosoftAuthenticator(IAuthenticator):
             logger.error(f"验证失败: {str(e)}")
             raise
 
-    async def _get_microsoft_token(self, refresh_token: Optional[str] = None) -> Dict:
+    async def _get_microsoft_token(self, refresh_token: Optional[str] = None, interactive: bool = True) -> Dict:
         # 使用asyncio.to_thread在异步上下文中运行同步的MSAL方法
         if refresh_token:
             # 使用刷新令牌获取新的访问令牌
@@ -77,10 +86,14 @@ class MicrosoftAuthenticator(IAuthenticator):
                 # 特别处理刷新令牌失效的情况
                 if result.get("error") == "invalid_grant":
                     logger.warning("刷新令牌已过期，需要重新认证")
+                    if not interactive:
+                        raise ReloginRequired("刷新令牌已过期，需要重新登录")
                     return await self._get_microsoft_token(None)  # 递归调用获取新令牌
                 raise Exception(f"刷新令牌失败: {result.get('error_description')}")
             return result
         else:
+            if not interactive:
+                raise ReloginRequired("没有可用的刷新令牌，需要重新登录")
             flow = await asyncio.to_thread(  # 使用设备代码流获取令牌
                 lambda: self.msal_app.initiate_device_flow(scopes=self.scopes)
             )
@@ -102,53 +115,53 @@ class MicrosoftAuthenticator(IAuthenticator):
         payload = {"Properties": {"AuthMethod": "RPS", "SiteName": "user.auth.xboxlive.com",
                                   "RpsTicket": f"d={microsoft_token}"}, "RelyingParty": "http://auth.xboxlive.com",
                    "TokenType": "JWT"}
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers={"Content-Type": "application/json", "Accept": "application/json"},
-                                    json=payload) as response:
-                response.raise_for_status()
-                data = await response.json()
-                return data["Token"], data["DisplayClaims"]["xui"][0]["uhs"]
+        session = await self.http_client.get_session()
+        async with session.post(url, headers={"Content-Type": "application/json", "Accept": "application/json"},
+                                json=payload) as response:
+            response.raise_for_status()
+            data = await response.json()
+            return data["Token"], data["DisplayClaims"]["xui"][0]["uhs"]
 
     async def _authenticate_with_xsts(self, xbl_token: str) -> Tuple[str, str]:
         url = self.xsts_auth_endpoint
         payload = {"Properties": {"SandboxId": "RETAIL", "UserTokens": [xbl_token]},
                    "RelyingParty": "rp://api.minecraftservices.com/", "TokenType": "JWT"}
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers={"Content-Type": "application/json", "Accept": "application/json"},
-                                    json=payload) as response:
-                if response.status == 401:
-                    data = await response.json()
-                    raise Exception(f"XSTS 验证失败: {data.get('XErr')} - {data.get('Message')}")
-                response.raise_for_status()
+        session = await self.http_client.get_session()
+        async with session.post(url, headers={"Content-Type": "application/json", "Accept": "application/json"},
+                                json=payload) as response:
+            if response.status == 401:
                 data = await response.json()
-                return data["Token"], data["DisplayClaims"]["xui"][0]["uhs"]
+                raise Exception(f"XSTS 验证失败: {data.get('XErr')} - {data.get('Message')}")
+            response.raise_for_status()
+            data = await response.json()
+            return data["Token"], data["DisplayClaims"]["xui"][0]["uhs"]
 
     async def _authenticate_with_minecraft(self, uhs: str, xsts_token: str) -> Dict:
         url = self.minecraft_auth_endpoint
         payload = {"identityToken": f"XBL3.0 x={uhs};{xsts_token}"}
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers={"Content-Type": "application/json"}, json=payload) as response:
-                response.raise_for_status()
-                return await response.json()
+        session = await self.http_client.get_session()
+        async with session.post(url, headers={"Content-Type": "application/json"}, json=payload) as response:
+            response.raise_for_status()
+            return await response.json()
 
     async def _check_game_ownership(self, access_token: str) -> bool:
         url = self.minecraft_entitlements_endpoint
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers={"Authorization": f"Bearer {access_token}"}) as response:
-                response.raise_for_status()
-                data = await response.json()
-                items = data.get("items", [])
-                return any(item.get("name") == "game_minecraft" for item in items)
+        session = await self.http_client.get_session()
+        async with session.get(url, headers={"Authorization": f"Bearer {access_token}"}) as response:
+            response.raise_for_status()
+            data = await response.json()
+            items = data.get("items", [])
+            return any(item.get("name") == "game_minecraft" for item in items)
 
     async def _get_minecraft_profile(self, access_token: str) -> Dict:
         url = self.minecraft_profile_endpoint
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers={"Authorization": f"Bearer {access_token}"}) as response:
-                response.raise_for_status()
-                return await response.json()
+        session = await self.http_client.get_session()
+        async with session.get(url, headers={"Authorization": f"Bearer {access_token}"}) as response:
+            response.raise_for_status()
+            return await response.json()
 
 class OfflineAuthenticator(IAuthenticator):
-    async def authenticate(self, refresh_token: Optional[str] = None) -> Dict:
+    async def authenticate(self, refresh_token: Optional[str] = None, interactive: bool = True) -> Dict:
         import uuid
         print("使用离线验证...")
         # 异步获取用户名
@@ -167,7 +180,7 @@ class OfflineAuthenticator(IAuthenticator):
 
 
 class ThirdPartyAuthenticator(IAuthenticator):
-    async def authenticate(self, refresh_token: Optional[str] = None) -> Dict:
+    async def authenticate(self, refresh_token: Optional[str] = None, interactive: bool = True) -> Dict:
         print("使用第三方验证...")
         return {"username": "ThirdPartyPlayer", "uuid": "11111111-1111-1111-1111-111111111111",
                 "access_token": "third_party_token", "refresh_token": "", "skins": [], "capes": []}
@@ -181,10 +194,10 @@ class AuthManager:
             AuthMethod.THIRD_PARTY: ThirdPartyAuthenticator()
         }
 
-    async def authenticate(self, method: AuthMethod, refresh_token: Optional[str] = None) -> Dict:
+    async def authenticate(self, method: AuthMethod, refresh_token: Optional[str] = None, interactive: bool = True) -> Dict:
         if method not in self._authenticators:
             raise ValueError(f"不支持的验证方式: {method}")
-        return await self._authenticators[method].authenticate(refresh_token)
+        return await self._authenticators[method].authenticate(refresh_token, interactive)
 
     @staticmethod
     async def async_input(prompt: str) -> str:
@@ -224,7 +237,8 @@ class AuthManager:
                         typ = "第三方"
                     else:
                         typ = "微软"
-                    print(f"{idx+1}. {user['username']} ({typ})")
+                    hint = "，需要重新登录" if user.get("needs_relogin") else ""
+                    print(f"{idx+1}. {user['username']} ({typ}{hint})")
                 sel = await cls.async_input("请选择要登录的账户编号: ")
                 try:
                     sel_idx = int(sel) - 1
@@ -241,6 +255,9 @@ class AuthManager:
     _selected_user = None
 
 class UserManager:
+    REFRESH_MARGIN = 3600  # 距过期不足 1 小时的令牌视为需要刷新
+    MAX_CONCURRENT_REFRESH = 4
+
     def __init__(self, data_file: str = "users.json"):
         self.data_file = data_file
         self.users = {}
@@ -320,25 +337,61 @@ class UserManager:
     def list_all_users(self) -> List[Dict]:
         return list(self.users.values())
 
-    async def refresh_all_users(self, auth_manager) -> None:
-        if not self.users:
-            logger.info("没有需要刷新的用户")
-            return
-        logger.debug(f"开始刷新 {len(self.users)} 个用户的账户信息...")
-        for uuid, user_data in list(self.users.items()):
+    def needs_refresh(self, user_data: Dict) -> bool:
+        # 没有过期时间记录的旧数据一律刷新一次，之后按 expires_at 判断
+        expires_at = user_data.get("expires_at")
+        return expires_at is None or expires_at - time.time() < self.REFRESH_MARGIN
+
+    async def _refresh_user(self, auth_manager, uuid: str, user_data: Dict,
+                            semaphore: asyncio.Semaphore) -> Optional[Dict]:
+        async with semaphore:
             try:
-                refresh_token = user_data.get("refresh_token")
-                if not refresh_token:
-                    logger.debug(f"用户 {uuid} 没有刷新令牌，跳过刷新")
-                    continue
-                logger.debug(f"正在刷新用户: {user_data['username']} ({uuid})")
-                new_data = await auth_manager.authenticate(method=AuthMethod.MICROSOFT, refresh_token=refresh_token)
+                logger.debug("正在刷新用户: %s (%s)", user_data['username'], uuid)
+                # 后台刷新不允许回退到设备码登录：多个账户同时弹出会互相覆盖剪贴板和浏览器页面
+                new_data = await auth_manager.authenticate(method=AuthMethod.MICROSOFT,
+                                                           refresh_token=user_data["refresh_token"], interactive=False)
                 new_data["uuid"] = uuid
-                await self.user_save(uuid, new_data)
                 logger.info(f"用户 {new_data['username']} ({uuid}) 刷新成功")
+                return new_data
+            except ReloginRequired:
+                logger.warning(f"用户 {user_data['username']} ({uuid}) 的登录已失效，请重新登录该账户")
+                return {**user_data, "needs_relogin": True}
             except Exception as e:
                 logger.error(f"刷新用户 {uuid} 失败: {str(e)}")
-        logger.info("所有用户刷新完成")
+                return None
+
+    async def refresh_all_users(self, auth_manager) -> None:
+        if not self.users:
+            logger.info("没有需要刷新的用户")
+            return
+        pending = {}
+        for uuid, user_data in self.users.items():
+            if not user_data.get("refresh_token"):
+                logger.debug("用户 %s 没有刷新令牌，跳过刷新", uuid)
+            elif user_data.get("needs_relogin"):
+                logger.debug("用户 %s 需要重新登录，跳过刷新", uuid)
+            elif not self.needs_refresh(user_data):
+                logger.debug("用户 %s 的令牌仍然有效，跳过刷新", uuid)
+            else:
+                pending[uuid] = user_data
+        skipped = len(self.users) - len(pending)
+        if not pending:
+            logger.info("没有需要刷新的账户")
+            return
+        logger.debug("开始并发刷新 %s 个用户的账户信息...", len(pending))
+        # 各账户的验证链互不依赖，限制并发数后同时进行，总耗时接近单次登录
+        semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_REFRESH)
+        results = await asyncio.gather(*(self._refresh_user(auth_manager, uuid, user_data, semaphore)
+                                         for uuid, user_data in pending.items()))
+        updated = {uuid: data for uuid, data in zip(pending, results) if data is not None}
+        refreshed = {uuid: data for uuid, data in updated.items() if not data.get("needs_relogin")}
+        if updated:
+            # 重新读取一次文件，保留刷新期间其他地方新增的账户，然后只加密写入一次
+            await self.user_load()
+            self.users.update(updated)
+            await self._save_to_file()
+        logger.info("用户刷新完成: 成功 %s 个，失败 %s 个，需重新登录 %s 个，跳过 %s 个",
+                    len(refreshed), len(pending) - len(updated), len(updated) - len(refreshed), skipped)
 
 async def perform_authentication(refresh_token: Optional[str] = None) -> Dict:
     manager = AuthManager()
@@ -370,5 +423,7 @@ if __name__ == "__main__":
             print(f"刷新令牌: {auth_result['refresh_token'][:20]}...")
         except Exception as e:
             print(f"验证失败: {str(e)}")
+        finally:
+            await shared_http_client.close()
 
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,356 @@
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+import psutil
+from aiohttp import web
+
+# 离线基准测试：本地 aiohttp 服务模拟 Mojang/BMCLAPI（版本清单、版本 JSON、资源索引、库与 natives jar），
+# 可注入延迟、限速与错误率，端到端测量下载、类路径/参数构建、natives 解压与哈希校验，结果输出为 JSON 便于跨提交对比
+# 用法: python bench.py --assets 2000 --latency 20 --bandwidth 4096 --error-rate 0.01
+
+
+class MockServer:
+    # 模拟下载源：所有文件内容在启动前生成并保存在内存中
+    def __init__(self, latency=0.0, bandwidth=0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.files = {}
+        self.requests = 0
+        self.errors = 0
+        self.base = None
+        self._runner = None
+
+    def add(self, path, data):
+        self.files[path] = data
+        return hashlib.sha1(data).hexdigest()
+
+    async def handle(self, request):
+        self.requests += 1
+        if self.latency: await asyncio.sleep(self.latency)
+        data = self.files.get(request.path)
+        if data is None: return web.Response(status=404)
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.errors += 1
+            return web.Response(status=503)
+        offset = 0
+        range_header = request.headers.get("Range", "")
+        if range_header.startswith("bytes="):
+            offset = int(range_header[6:].split("-")[0] or 0)
+            if offset >= len(data): return web.Response(status=416)
+        body = data[offset:]
+        response = web.StreamResponse(status=206 if offset else 200)
+        response.content_length = len(body)
+        await response.prepare(request)
+        chunk_size = 64 * 1024
+        for start in range(0, len(body), chunk_size):
+            chunk = body[start:start + chunk_size]
+            await response.write(chunk)
+            # 按 bandwidth（字节/秒，按连接计算）限速
+            if self.bandwidth: await asyncio.sleep(len(chunk) / self.bandwidth)
+        await response.write_eof()
+        return response
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/{path:.*}", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.base = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+        return self.base
+
+    async def stop(self):
+        if self._runner: await self._runner.cleanup()
+
+
+def native_header():
+    # 与当前平台架构匹配的动态库头部，使 natives 解压的架构检查能够通过
+    is_64 = "64" in platform.architecture()[0]
+    if platform.system().lower() == "windows":
+        return b"MZ" + bytes(0x3A) + struct.pack("<I", 0x40) + b"PE\0\0" + struct.pack("<H", 0x8664 if is_64 else 0x014C)
+    return b"\x7fELF" + bytes([2 if is_64 else 1])
+
+
+def build_version(server: MockServer, version, n_assets, n_libraries, n_natives, seed=0):
+    # 生成合成的版本清单、版本 JSON 与资源索引，形状与官方一致
+    rng = random.Random(seed)
+    base = server.base
+    objects = {}
+    for i in range(n_assets):
+        data = rng.randbytes(rng.randint(1024, 16 * 1024))
+        sha1 = hashlib.sha1(data).hexdigest()
+        server.files[f"/assets/{sha1[:2]}/{sha1}"] = data
+        objects[f"minecraft/bench/{i}.ogg"] = {"hash": sha1, "size": len(data)}
+    index = json.dumps({"objects": objects}).encode()
+    index_sha1 = server.add(f"/v1/packages/index/{version}.json", index)
+    client = rng.randbytes(2 * 1024 * 1024)
+    client_sha1 = server.add(f"/v1/objects/{version}/client.jar", client)
+    os_name = {"windows": "windows", "darwin": "osx"}.get(platform.system().lower(), "linux")
+    libraries = []
+    for i in range(n_libraries):
+        data = rng.randbytes(rng.randint(16 * 1024, 256 * 1024))
+        path = f"bench/lib{i}/1.0/lib{i}-1.0.jar"
+        sha1 = server.add(f"/maven/{path}", data)
+        libraries.append({"name": f"bench:lib{i}:1.0", "downloads": {"artifact": {"path": path, "url": f"{base}/maven/{path}", "sha1": sha1, "size": len(data)}}})
+    header = native_header()
+    for i in range(n_natives):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as jar:
+            jar.writestr("META-INF/MANIFEST.MF", b"Manifest-Version: 1.0\n")
+            for j in range(4):
+                jar.writestr(f"libnative{i}_{j}.so", header + rng.randbytes(256 * 1024))
+        data = buffer.getvalue()
+        path = f"bench/native{i}/1.0/native{i}-1.0-natives-{os_name}.jar"
+        sha1 = server.add(f"/maven/{path}", data)
+        libraries.append({"name": f"bench:native{i}:1.0", "natives": {os_name: f"natives-{os_name}"},
+                          "downloads": {"classifiers": {f"natives-{os_name}": {"path": path, "url": f"{base}/maven/{path}", "sha1": sha1, "size": len(data)}}}})
+    version_info = {
+        "id": version, "type": "release", "mainClass": "net.minecraft.client.main.Main", "assets": version,
+        "assetIndex": {"id": version, "url": f"{base}/v1/packages/index/{version}.json", "sha1": index_sha1, "size": len(index)},
+        "downloads": {"client": {"url": f"{base}/v1/objects/{version}/client.jar", "sha1": client_sha1, "size": len(client)}},
+        "libraries": libraries,
+        "arguments": {
+            "game": ["--username", "${auth_player_name}", "--version", "${version_name}", "--gameDir", "${game_directory}",
+                     "--assetsDir", "${assets_root}", "--assetIndex", "${assets_index_name}", "--uuid", "${auth_uuid}",
+                     "--accessToken", "${auth_access_token}", "--userType", "${user_type}", "--versionType", "${version_type}",
+                     {"rules": [{"action": "allow", "features": {"is_demo_user": True}}], "value": "--demo"}],
+            "jvm": [{"rules": [{"action": "allow", "os": {"name": "osx"}}], "value": ["-XstartOnFirstThread"]},
+                    "-Djava.library.path=${natives_directory}", "-cp", "${classpath}"],
+        },
+        "javaVersion": {"majorVersion": 17},
+    }
+    version_json = json.dumps(version_info).encode()
+    version_sha1 = server.add(f"/v1/packages/{version}.json", version_json)
+    manifest = {"latest": {"release": version, "snapshot": version},
+                "versions": [{"id": version, "type": "release", "url": f"{base}/v1/packages/{version}.json", "sha1": version_sha1}]}
+    server.add("/mc/game/version_manifest_v2.json", json.dumps(manifest).encode())
+    return version_info
+
+
+class ResourceSampler:
+    # 定期采样当前进程的 RSS 与打开的文件描述符（Windows 上为句柄）数量，记录峰值
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak_rss = 0
+        self.peak_fds = 0
+        self._task = None
+
+    def sample(self):
+        self.peak_rss = max(self.peak_rss, self.process.memory_info().rss)
+        fds = self.process.num_fds() if hasattr(self.process, "num_fds") else self.process.num_handles()
+        self.peak_fds = max(self.peak_fds, fds)
+
+    async def _run(self):
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+    def __enter__(self):
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+        self.sample()
+
+
+def percentile(values, fraction):
+    if not values: return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def latency_stats(values):
+    return {"count": len(values), "p50": percentile(values, 0.5), "p99": percentile(values, 0.99), "max": max(values) if values else None}
+
+
+async def run_benchmark(args):
+    from downloader import DownloadClass
+    from launcher import MinecraftLauncher
+    from utils import Utils, http_client, hash_engine
+
+    server = MockServer(args.latency / 1000, args.bandwidth * 1024, args.error_rate, args.seed)
+    await server.start()
+    version = "bench"
+    version_info = build_version(server, version, args.assets, args.libraries, args.natives, args.seed)
+    config = {
+        "minecraft_base_dir": ".minecraft",
+        "version_manifest_path": os.path.join(".minecraft", "version_manifest.json"),
+        "resource_download_base_url": f"{server.base}/assets",
+        "bmclapi_base_url": server.base,
+        "use_mirror": False,
+        "max_concurrent_downloads": args.concurrency,
+        "max_connections_per_host": args.per_host,
+        "max_retries": 8,
+        "retry_base_delay": 0.05,
+        "download_metrics_file": None,
+    }
+    os_name, os_arch = await Utils().get_os_info()
+    results = {"parameters": vars(args)}
+
+    class TimedDownloader(DownloadClass):
+        # 记录每个文件从开始下载到完成（含校验）的耗时
+        latencies = []
+
+        async def download_file(self, url, dest, sha1=None):
+            start = time.perf_counter()
+            await super().download_file(url, dest, sha1)
+            self.latencies.append(time.perf_counter() - start)
+
+    http_client.configure(limit=args.concurrency, limit_per_host=args.per_host)
+    session = await http_client.get_session()
+    downloader = TimedDownloader(session, config)
+    try:
+        # 元数据：版本清单（无 SHA1，条件请求路径）与版本 JSON（带 / 不带 SHA1 两条路径）；每轮用新的下载器，不命中内存缓存
+        metadata = {}
+        versions_dir = os.path.join(config["minecraft_base_dir"], "versions", version)
+        for phase in ("cold", "warm"):
+            fetcher = DownloadClass(session, config)
+            start = time.perf_counter()
+            manifest = await fetcher.fetch_json(f"{server.base}/mc/game/version_manifest_v2.json", config["version_manifest_path"])
+            entry = next(item for item in manifest["versions"] if item["id"] == version)
+            hashed = await fetcher.fetch_json(entry["url"], os.path.join(versions_dir, f"{version}.json"), entry["sha1"])
+            unhashed = await fetcher.fetch_json(entry["url"], os.path.join(versions_dir, f"{version}.unhashed.json"))
+            metadata[phase] = round(time.perf_counter() - start, 4)
+            if hashed != version_info or unhashed != version_info:
+                raise RuntimeError("获取到的版本 JSON 与模拟服务器提供的不一致")
+        results["metadata"] = {"cold_seconds": metadata["cold"], "warm_seconds": metadata["warm"]}
+        version_info = hashed
+        requests_before, errors_before = server.requests, server.errors
+
+        with ResourceSampler() as sampler:
+            start = time.perf_counter()
+            plan = await downloader.download_version(version_info, version, os_name, os_arch)
+            elapsed = time.perf_counter() - start
+        snapshot = downloader.progress.snapshot()
+        results["download_cold"] = {
+            "seconds": round(elapsed, 4),
+            "files": len(plan.fetch) + len(plan.link) + len(plan.repair),
+            "bytes": snapshot["completed_bytes"],
+            "bytes_per_second": round(snapshot["completed_bytes"] / elapsed) if elapsed else 0,
+            "retries": snapshot["retries"],
+            "failed_files": snapshot["failed_files"],
+            "file_latency": latency_stats(TimedDownloader.latencies),
+            "peak_rss": sampler.peak_rss,
+            "peak_fds": sampler.peak_fds,
+            "server_requests": server.requests - requests_before,
+            "server_injected_errors": server.errors - errors_before,
+        }
+
+        TimedDownloader.latencies = []
+        with ResourceSampler() as sampler:
+            start = time.perf_counter()
+            plan = await downloader.download_version(version_info, version, os_name, os_arch)
+            elapsed = time.perf_counter() - start
+        results["download_warm"] = {"seconds": round(elapsed, 4), "skipped": len(plan.skip), "peak_rss": sampler.peak_rss, "peak_fds": sampler.peak_fds}
+
+        # 类路径与启动参数：冷启动（无启动配置缓存）与热启动各测若干次
+        class BenchUtils(Utils):
+            async def async_find_java(self, config, required_version=None):
+                return {os.path.dirname(sys.executable): f"Java {required_version or 17}"}
+
+        launcher = MinecraftLauncher()
+        auth_info = {"username": "Bench", "uuid": "00000000-0000-0000-0000-000000000000", "access_token": "token", "user_type": "msa"}
+        profile_path = os.path.join(config["minecraft_base_dir"], "versions", version, MinecraftLauncher.PROFILE_NAME)
+        cold, warm = [], []
+        for _ in range(args.iterations):
+            if os.path.exists(profile_path): os.remove(profile_path)
+            start = time.perf_counter()
+            await launcher.get_args(version_info, version, True, config, BenchUtils(), auth_info=auth_info)
+            cold.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            await launcher.get_args(version_info, version, True, config, BenchUtils(), auth_info=auth_info)
+            warm.append(time.perf_counter() - start)
+        results["launch_args"] = {"cold": latency_stats(cold), "warm": latency_stats(warm)}
+
+        # natives 解压：清空目标目录后重新并行解压全部 natives jar
+        extract_path = os.path.join(config["minecraft_base_dir"], "versions", version, f"{version}-natives")
+        natives = [artifact["path"] for artifact in plan.natives]
+        shutil.rmtree(extract_path, ignore_errors=True)
+        os.makedirs(extract_path)
+        start = time.perf_counter()
+        extracted = await asyncio.gather(*(downloader.natives_extractor.extract(path, extract_path) for path in natives))
+        results["extract"] = {"seconds": round(time.perf_counter() - start, 4), "jars": len(natives), "files": sum(len(files) for files in extracted)}
+
+        # 哈希：对全部已下载文件做完整的 SHA1 校验（不使用校验索引）
+        artifacts = [artifact for artifact in plan.skip if artifact["sha1"]]
+        start = time.perf_counter()
+        mismatched = await hash_engine.verify_many([a["path"] for a in artifacts], [a["sha1"] for a in artifacts])
+        elapsed = time.perf_counter() - start
+        total = sum(os.path.getsize(a["path"]) for a in artifacts)
+        results["hash"] = {"seconds": round(elapsed, 4), "files": len(artifacts), "bytes": total,
+                           "bytes_per_second": round(total / elapsed) if elapsed else 0, "mismatched": len(mismatched)}
+    finally:
+        await http_client.close()
+        await server.stop()
+    return results
+
+
+def git_revision(path):
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=path, capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="QCL 离线基准测试")
+    parser.add_argument("--assets", type=int, default=2000, help="资源文件数量")
+    parser.add_argument("--libraries", type=int, default=60, help="库文件数量")
+    parser.add_argument("--natives", type=int, default=4, help="natives jar 数量")
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求注入的延迟（毫秒）")
+    parser.add_argument("--bandwidth", type=int, default=0, help="每个连接的带宽上限（KiB/s），0 表示不限速")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="随机返回 503 的请求比例")
+    parser.add_argument("--concurrency", type=int, default=64, help="最大并发下载数")
+    parser.add_argument("--per-host", type=int, default=16, help="每个主机的最大连接数")
+    parser.add_argument("--iterations", type=int, default=20, help="启动参数构建的重复次数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子，保证各次运行的数据一致")
+    parser.add_argument("--output", default="bench_output.txt", help="结果 JSON 的输出文件")
+    parser.add_argument("--keep", action="store_true", help="保留临时工作目录")
+    args = parser.parse_args()
+
+    project_root = os.path.dirname(os.path.abspath(__file__))
+    output = os.path.abspath(args.output)
+    workdir = tempfile.mkdtemp(prefix="qcl-bench-")
+    # 所有相对路径（QCL/ 下的索引与缓存、.minecraft）都落在临时目录中，不影响真实数据
+    os.chdir(workdir)
+    try:
+        results = asyncio.run(run_benchmark(args))
+    finally:
+        os.chdir(project_root)
+        if not args.keep: shutil.rmtree(workdir, ignore_errors=True)
+    results["revision"] = git_revision(project_root)
+    results["python"] = platform.python_version()
+    results["platform"] = platform.platform()
+    try:
+        import resource
+        # ru_maxrss 在 Linux 上以 KiB 为单位，macOS 上为字节
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        results["peak_rss"] = max_rss if sys.platform == "darwin" else max_rss * 1024
+    except ImportError:
+        results["peak_rss"] = psutil.Process().memory_info().peak_wset
+    text = json.dumps(results, indent=2, ensure_ascii=False)
+    with open(output, "w", encoding="utf-8") as f:
+        f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,143 +1,933 @@
 import asyncio
+import hashlib
+import itertools
 import json
 import os
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
 import aiofiles
-from utils import Utils, logger
+from utils import Utils, VerifiedFileIndex, ContentStore, NativesExtractor, hash_engine, logger, tracer, read_json_file, write_json_file, ensure_dir_exists
 
 class IDownloader:
     async def download_file(self, url, dest, sha1=None): pass
-    async def download_log4j2(self, version_info, version): pass
-    async def download_library(self, library, os_name, os_arch, version): pass
-    async def download_libraries(self, version_info, version, os_name, os_arch): pass
-    def replace_with_mirror(self, url): pass
-    async def download_assets(self, version_info): pass
-    async def download_version(self, version_info, version, os_name, os_arch): pass
+    async def fetch_json(self, url, dest, sha1=None, offline=False): pass
+    def resolve_artifacts(self, version_info, version, os_name, os_arch, asset_index=None): pass
+    async def plan_version(self, version_info, version, os_name, os_arch, offline=False): pass
+    async def execute_plan(self, plan, version): pass
+    async def download_version(self, version_info, version, os_name, os_arch, dry_run=False): pass
+    def update_config(self, config, old_config=None): pass
+
+class DownloadScheduler:
+    # 数字越小越先下载：核心 jar 与库 > log4j2 > 资源文件
+    PRIORITY_CORE = 0
+    PRIORITY_LOG4J2 = 1
+    PRIORITY_ASSETS = 2
+
+    def __init__(self, max_concurrency=64, max_per_host=16):
+        self.max_concurrency = max_concurrency
+        self.max_per_host = max_per_host
+        self._queue = asyncio.PriorityQueue()
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+        self._counter = itertools.count()
+        self._workers = []
+
+    def submit(self, priority, job) -> asyncio.Future:
+        # job 为无参协程函数，仅在拿到全局并发额度后才会被创建，避免成千上万个协程同时存在
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((priority, next(self._counter), job, future))
+        return future
+
+    async def host_slot(self, host) -> "HostSlot":
+        # 主机并发额度按实际请求的源（选定镜像之后的 netloc）占用，而不是原始地址的主机
+        semaphore = self._host_limits.setdefault(host, asyncio.Semaphore(self.max_per_host))
+        await semaphore.acquire()
+        return HostSlot(semaphore)
+
+    async def _worker(self):
+        while True:
+            priority, _, job, future = await self._queue.get()
+            try:
+                if future.cancelled(): continue
+                result = await job()
+                if not future.done(): future.set_result(result)
+            except asyncio.CancelledError:
+                if not future.done(): future.cancel()
+                raise
+            except Exception as e:
+                if not future.done(): future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    async def __aenter__(self):
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_concurrency)]
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        for worker in self._workers: worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        # 取消仍在排队的任务，避免调用方永久等待
+        while not self._queue.empty():
+            *_, future = self._queue.get_nowait()
+            if not future.done(): future.cancel()
+
+class HostSlot:
+    # 已占用的一个主机并发额度，随响应一同退出（或被丢弃）时归还；未启用调度器时为空操作
+    def __init__(self, semaphore=None):
+        self._semaphore = semaphore
+
+    def release(self):
+        if self._semaphore is not None:
+            self._semaphore.release()
+            self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+class InstallPlan:
+    # 每个文件为 {"url", "path", "sha1", "size", "priority", "extract"}
+    def __init__(self, version):
+        self.version = version
+        self.fetch: List[Dict] = []
+        self.link: List[Dict] = []
+        self.repair: List[Dict] = []
+        self.skip: List[Dict] = []
+        self.natives: List[Dict] = []
+        self.assets_resolved = True
+
+    @property
+    def bytes_to_fetch(self):
+        return sum(artifact['size'] for artifact in self.fetch + self.repair)
+
+    def summary(self):
+        text = (f"版本 {self.version}: 需下载 {len(self.fetch)} 个文件，修复 {len(self.repair)} 个（共 {self.bytes_to_fetch / 1024 / 1024:.1f} MB），"
+                f"从共享仓库链接 {len(self.link)} 个，跳过 {len(self.skip)} 个")
+        if not self.assets_resolved: text += "（本地没有资源索引，资源文件未计入）"
+        return text
+
+class DownloadProgress:
+    # 下载进度与吞吐统计：可通过 subscribe 注册回调 callback(event, snapshot)，或用 async for 迭代 events()
+    EMIT_INTERVAL = 0.1
+
+    def __init__(self):
+        self._subscribers = []
+        self._last_emit = 0.0
+        self._active = False
+        self.reset()
+
+    def reset(self, version=None, total_files=0, total_bytes=0):
+        self.version = version
+        self.started_at = time.time()
+        self._started = time.monotonic()
+        self._finished = None
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.completed_files = 0
+        self.failed_files = 0
+        self.completed_bytes = 0
+        self.in_flight = 0
+        self.retries = 0
+        self.sha1_failures = 0
+        self.hosts: Dict[str, Dict] = {}
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers: self._subscribers.remove(callback)
+
+    async def events(self):
+        queue = asyncio.Queue()
+
+        def on_event(event, snapshot): queue.put_nowait((event, snapshot))
+
+        self.subscribe(on_event)
+        try:
+            while True:
+                event, snapshot = await queue.get()
+                yield snapshot
+                if event == "finished": return
+        finally:
+            self.unsubscribe(on_event)
+
+    def _emit(self, event="progress", force=False):
+        now = time.monotonic()
+        # 规划阶段（如下载资源索引）产生的字节不计入进度
+        if not self._active or not self._subscribers or (not force and now - self._last_emit < self.EMIT_INTERVAL): return
+        self._last_emit = now
+        snapshot = self.snapshot()
+        for callback in list(self._subscribers):
+            try:
+                callback(event, snapshot)
+            except Exception as e:
+                logger.debug("进度回调出错: %s", e)
+
+    def begin(self, plan):
+        items = plan.link + plan.fetch + plan.repair
+        self.reset(plan.version, len(items), plan.bytes_to_fetch)
+        self._active = True
+        self._emit("started", force=True)
+
+    def finish(self):
+        self._finished = time.monotonic()
+        self._emit("finished", force=True)
+        self._active = False
+
+    def file_started(self):
+        self.in_flight += 1
+
+    def file_stopped(self):
+        self.in_flight -= 1
+
+    def file_done(self, future):
+        if future.cancelled() or future.exception() is not None:
+            self.failed_files += 1
+        else:
+            self.completed_files += 1
+        self._emit()
+
+    def add_bytes(self, nbytes):
+        self.completed_bytes += nbytes
+        self._emit()
+
+    def record_host(self, host, nbytes, elapsed):
+        stats = self.hosts.setdefault(host, {"files": 0, "bytes": 0, "seconds": 0.0})
+        stats["files"] += 1
+        stats["bytes"] += nbytes
+        stats["seconds"] += elapsed
+
+    def retried(self):
+        self.retries += 1
+
+    def sha1_failed(self, discarded_bytes):
+        # 校验失败的 .part 会被删除，已计入的字节需要扣回
+        self.sha1_failures += 1
+        self.completed_bytes -= discarded_bytes
+
+    def snapshot(self) -> Dict:
+        elapsed = (self._finished or time.monotonic()) - self._started
+        return {
+            "version": self.version,
+            "started_at": self.started_at,
+            "elapsed": round(elapsed, 3),
+            "finished": self._finished is not None,
+            "total_files": self.total_files,
+            "completed_files": self.completed_files,
+            "failed_files": self.failed_files,
+            "total_bytes": self.total_bytes,
+            "completed_bytes": self.completed_bytes,
+            "bytes_per_second": round(self.completed_bytes / elapsed) if elapsed > 0 else 0,
+            "in_flight": self.in_flight,
+            "retries": self.retries,
+            "sha1_failures": self.sha1_failures,
+            "hosts": {
+                host: dict(stats, bytes_per_second=round(stats["bytes"] / stats["seconds"]) if stats["seconds"] > 0 else 0)
+                for host, stats in self.hosts.items()
+            },
+        }
+
+    def dump_json(self, path):
+        # 每次安装追加一行 JSON，便于长期对比安装性能
+        ensure_dir_exists(os.path.dirname(path) or ".")
+        with open(path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(self.snapshot(), ensure_ascii=False) + "\n")
+
+    @staticmethod
+    def render_line(snapshot) -> str:
+        mb = 1024 * 1024
+        return (f"下载进度: {snapshot['completed_files']}/{snapshot['total_files']} 个文件 | "
+                f"{snapshot['completed_bytes'] / mb:.1f}/{snapshot['total_bytes'] / mb:.1f} MB | "
+                f"{snapshot['bytes_per_second'] / mb:.2f} MB/s | 进行中 {snapshot['in_flight']} | "
+                f"重试 {snapshot['retries']} | 校验失败 {snapshot['sha1_failures']}")
+
+class MetadataCache:
+    # 版本清单等元数据：磁盘上记录 ETag/Last-Modified 用于条件请求，内存中保留解析结果供菜单循环复用
+    def __init__(self, cache_file=os.path.join("QCL", "http_cache.json"), ttl=600):
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self._validators = None
+        self._memory: Dict[str, tuple] = {}
+
+    def get(self, url, sha1=None):
+        entry = self._memory.get(url)
+        if entry is None: return None
+        fetched_at, entry_sha1, data = entry
+        # 带 SHA1 的内容按哈希寻址，永不过期；否则在 ttl 内直接复用
+        if sha1: return data if entry_sha1 == sha1 else None
+        return data if time.monotonic() - fetched_at < self.ttl else None
+
+    def remember(self, url, data, sha1=None):
+        self._memory[url] = (time.monotonic(), sha1, data)
+
+    async def validators(self, url) -> Dict:
+        if self._validators is None:
+            try:
+                self._validators = await read_json_file(self.cache_file) if os.path.exists(self.cache_file) else {}
+            except Exception as e:
+                logger.warning(f"读取元数据缓存失败: {str(e)}")
+                self._validators = {}
+        return self._validators.get(url, {})
+
+    async def save_validators(self, url, etag, last_modified):
+        await self.validators(url)
+        self._validators[url] = {"etag": etag, "last_modified": last_modified}
+        ensure_dir_exists(os.path.dirname(self.cache_file))
+        await write_json_file(self.cache_file, self._validators)
+
+class DownloadError(Exception):
+    def __init__(self, failed):
+        # failed 为 [(文件路径, 异常)]
+        super().__init__(f"{len(failed)} 个文件下载失败: " + ", ".join(os.path.basename(path) for path, _ in failed[:5]) + (" ..." if len(failed) > 5 else ""))
+        self.failed = failed
+
+class CircuitOpenError(Exception):
+    def __init__(self, host, retry_after):
+        super().__init__(f"主机 {host} 已熔断，{retry_after:.1f} 秒后重试")
+        self.host = host
+        self.retry_after = retry_after
+
+class RetryPolicy:
+    # 指数退避 + 完全抖动（full jitter），并尊重服务器返回的 Retry-After
+    PERMANENT_STATUS = (400, 401, 403, 404, 410)
+
+    def __init__(self, max_retries=5, base_delay=0.5, max_delay=30.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt, retry_after=None):
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None: delay = max(delay, min(retry_after, self.max_delay * 10))
+        return delay
+
+    @staticmethod
+    def retry_after(error) -> Optional[float]:
+        headers = getattr(error, 'headers', None)
+        value = headers.get("Retry-After") if headers else None
+        if not value: return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            try:
+                return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+            except (TypeError, ValueError):
+                return None
+
+    @classmethod
+    def is_permanent(cls, error):
+        # 这类错误换一个源或许能成功，但在同一个源上重试没有意义
+        return getattr(error, 'status', None) in cls.PERMANENT_STATUS
+
+    @classmethod
+    def trips_breaker(cls, error):
+        # 404 之类说明主机本身正常，不计入熔断
+        return not cls.is_permanent(error)
+
+class CircuitBreaker:
+    # 按主机熔断：连续失败达到阈值后打开并暂停该主机；冷却结束进入半开，只放行一个探测请求，成功则关闭，失败则冷却时间加倍
+    FAILURE_THRESHOLD = 5
+    COOLDOWN = 5.0
+    MAX_COOLDOWN = 300.0
+
+    def __init__(self):
+        self._hosts: Dict[str, Dict] = {}
+
+    def _entry(self, host):
+        return self._hosts.setdefault(host, {"failures": 0, "open_until": 0.0, "cooldown": self.COOLDOWN, "probing": False})
+
+    def is_open(self, host):
+        entry = self._hosts.get(host)
+        return entry is not None and (entry["open_until"] > time.monotonic() or entry["probing"])
+
+    def allow(self, host):
+        entry = self._hosts.get(host)
+        if entry is None: return True
+        if entry["open_until"] > time.monotonic() or entry["probing"]: return False
+        if entry["failures"] >= self.FAILURE_THRESHOLD: entry["probing"] = True
+        return True
+
+    def wait_time(self, host):
+        entry = self._hosts.get(host)
+        if entry is None: return 0.0
+        remaining = entry["open_until"] - time.monotonic()
+        # 半开状态下等待探测结果，加入抖动避免大量协程同时醒来
+        return remaining + random.uniform(0, 1) if remaining > 0 else random.uniform(0.5, 1.5)
+
+    def cancel_probe(self, host):
+        entry = self._hosts.get(host)
+        if entry is not None: entry["probing"] = False
+
+    def record_success(self, host):
+        entry = self._hosts.get(host)
+        if entry is None: return
+        if entry["failures"] >= self.FAILURE_THRESHOLD: logger.info(f"主机 {host} 已恢复")
+        self._hosts.pop(host)
+
+    def record_failure(self, host, retry_after=None):
+        entry = self._entry(host)
+        entry["failures"] += 1
+        was_probing = entry["probing"]
+        entry["probing"] = False
+        now = time.monotonic()
+        if retry_after is not None:
+            # 服务器明确要求等待（429/503 + Retry-After），按其要求暂停该主机
+            entry["open_until"] = max(entry["open_until"], now + retry_after)
+            return
+        if entry["failures"] < self.FAILURE_THRESHOLD or entry["open_until"] > now: return
+        if was_probing: entry["cooldown"] = min(entry["cooldown"] * 2, self.MAX_COOLDOWN)
+        entry["open_until"] = now + entry["cooldown"]
+        logger.warning(f"主机 {host} 连续失败，暂停请求 {entry['cooldown']:.0f} 秒")
+
+class EndpointSelector:
+    # 官方地址前缀及其在 BMCLAPI 兼容镜像上的对应路径
+    OFFICIAL_ROUTES = [
+        ("https://libraries.minecraft.net", "/maven"),
+        ("https://resources.download.minecraft.net", "/assets"),
+        ("https://launcher.mojang.com", ""),
+        ("https://launchermeta.mojang.com", ""),
+        ("https://piston-meta.mojang.com", ""),
+        ("https://piston-data.mojang.com", ""),
+    ]
+    DEFAULT_LATENCY = 0.3
+    DEFAULT_THROUGHPUT = 1024 * 1024
+    TYPICAL_SIZE = 256 * 1024
+    EWMA_ALPHA = 0.3
+
+    def __init__(self, config, breaker=None):
+        self.config = config
+        self.breaker = breaker or CircuitBreaker()
+        self._stats: Dict[str, Dict] = {}
+
+    def _origins(self):
+        mirrors = [("bmclapi", self.config['bmclapi_base_url'])]
+        mirrors += [(base, base) for base in self.config.get('extra_mirrors', [])]
+        origins = [("official", None)] + [(name, base.rstrip("/")) for name, base in mirrors if base]
+        if self.config.get('use_mirror'):
+            origins = origins[1:] + origins[:1]
+        return origins
+
+    def _map(self, url, base):
+        if base is None: return url
+        routes = list(self.OFFICIAL_ROUTES)
+        resource_base = self.config.get('resource_download_base_url')
+        if resource_base: routes.append((resource_base.rstrip("/"), "/assets"))
+        for prefix, path in routes:
+            if url.startswith(prefix + "/"):
+                return base + path + url[len(prefix):]
+        return None
+
+    def _score(self, origin):
+        stats = self._stats.get(origin)
+        if stats is None:
+            return self.DEFAULT_LATENCY + self.TYPICAL_SIZE / self.DEFAULT_THROUGHPUT
+        return stats["latency"] + self.TYPICAL_SIZE / max(stats["throughput"], 1)
+
+    def candidates(self, url):
+        # 返回 [(源名称, 地址)]：熔断器未打开的源在前，按预估耗时排序，配置中的先后顺序作为少量偏置
+        result = []
+        for index, (origin, base) in enumerate(self._origins()):
+            mapped = self._map(url, base)
+            if mapped: result.append((self.breaker.is_open(urlparse(mapped).netloc), self._score(origin) + index * 0.05, origin, mapped))
+        result.sort(key=lambda item: item[:2])
+        return [(origin, mapped) for _, _, origin, mapped in result]
+
+    def _entry(self, origin):
+        return self._stats.setdefault(origin, {"latency": self.DEFAULT_LATENCY, "throughput": self.DEFAULT_THROUGHPUT})
+
+    def record_success(self, origin, latency, nbytes=0, elapsed=0.0):
+        stats = self._entry(origin)
+        stats["latency"] += self.EWMA_ALPHA * (latency - stats["latency"])
+        # 太小的文件测不出吞吐，只更新延迟
+        if nbytes >= 64 * 1024 and elapsed > 0:
+            stats["throughput"] += self.EWMA_ALPHA * (nbytes / elapsed - stats["throughput"])
 
 class DownloadClass(IDownloader):
+    SMALL_FILE_SIZE = 256 * 1024
+
     def __init__(self, session, config):
         self.session = session
         self.config = config
         self.utils = Utils()
+        self.scheduler = None
+        self.file_index = VerifiedFileIndex()
+        self.metadata_cache = MetadataCache(ttl=config.get('metadata_cache_ttl', 600))
+        self.retry_policy = RetryPolicy(config.get('max_retries', 5), config.get('retry_base_delay', 0.5), config.get('retry_max_delay', 30.0))
+        self.endpoints = EndpointSelector(config, CircuitBreaker())
+        self.progress = DownloadProgress()
+        self.natives_extractor = NativesExtractor(self.utils)
+        self.content_store = ContentStore(config.get('content_store_dir', os.path.join("QCL", "store")))
+
+    def update_config(self, config, old_config=None):
+        # 配置热更新：镜像、重试与缓存设置从下一次请求起生效，已积累的下载源测速与熔断状态保留
+        self.config = config
+        self.endpoints.config = config
+        self.retry_policy = RetryPolicy(config.get('max_retries', 5), config.get('retry_base_delay', 0.5), config.get('retry_max_delay', 30.0))
+        self.metadata_cache.ttl = config.get('metadata_cache_ttl', 600)
+        self.content_store = ContentStore(config.get('content_store_dir', os.path.join("QCL", "store")))
+
+    def _submit(self, url, dest, sha1=None, priority=DownloadScheduler.PRIORITY_ASSETS) -> asyncio.Future:
+        if self.scheduler is None:
+            return asyncio.ensure_future(self.download_file(url, dest, sha1))
+        return self.scheduler.submit(priority, lambda: self.download_file(url, dest, sha1))
 
     async def download_file(self, url, dest, sha1=None):
-        logger.debug(f"开始下载文件: {url}")
+        logger.debug("开始下载文件: %s", url)
         if os.path.exists(dest):
             if sha1:
-                file_sha1 = await self.utils.calculate_sha1(dest)
-                if file_sha1 == sha1: return
+                if self.file_index.is_verified(dest, sha1) or await self.utils.calculate_sha1(dest) == sha1:
+                    self.file_index.record(dest, sha1)
+                    await self._add_to_store(dest, sha1)
+                    return
                 else:
                     logger.error(f"SHA1校验失败: {dest}")
                     os.remove(dest)
             else: os.remove(dest)
+        if sha1 and self.config.get('use_content_store', True):
+            if await asyncio.to_thread(self.content_store.materialize, sha1, dest, self.file_index):
+                logger.debug("从共享仓库链接文件: %s", dest)
+                return
+        self.progress.file_started()
+        try:
+            await self._fetch_to_dest(url, dest, sha1)
+        finally:
+            self.progress.file_stopped()
+
+    async def _fetch_to_dest(self, url, dest, sha1):
+        # 先写入旁路的 .part 文件，中断后用 Range 续传，校验通过后再原子替换到目标位置
+        part_path = dest + ".part"
         retry_count = 0
-        max_retries = 5
+        max_retries = self.retry_policy.max_retries
+        tried = set()
+        permanent = set()
         while True:
+            origin = source_url = None
             try:
-                async with self.session.get(url) as response:
-                    response.raise_for_status()
-                    os.makedirs(os.path.dirname(dest), exist_ok=True)
-                    async with aiofiles.open(dest, 'wb') as file:
-                        while True:
-                            chunk = await response.content.read(1024 * 1024)
-                            if not chunk: break
-                            await file.write(chunk)
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+                headers = {"Range": f"bytes={offset}-"} if offset else None
+                # 优先尝试本文件尚未失败过的源，都失败过后再从头轮换
+                candidates = [c for c in self.endpoints.candidates(url) if c[0] not in tried]
+                if not candidates:
+                    tried.clear()
+                    candidates = self.endpoints.candidates(url)
+                origin, source_url, response, latency, slot = await self._open(candidates, headers, tried, permanent)
+                async with slot, response:
+                    if response.status == 416:
+                        # 续传起点越界：.part 可能已完整（上次在改名前被中断），否则只能从头下载
+                        if sha1 and await self.utils.calculate_sha1(part_path) == sha1:
+                            self.endpoints.breaker.record_success(urlparse(source_url).netloc)
+                            os.replace(part_path, dest)
+                            self.file_index.record(dest, sha1)
+                            await self._add_to_store(dest, sha1)
+                            logger.debug("文件下载成功: %s", dest)
+                            return
+                        os.remove(part_path)
+                        raise ValueError(f"续传范围无效，将重新下载: {source_url}")
+                    if offset and response.status == 206:
+                        logger.debug("从第 %s 字节处续传: %s", offset, source_url)
+                        mode = 'ab'
+                    else:
+                        mode = 'wb'
+                    # 边下载边计算 SHA1；续传时先用已下载部分初始化哈希状态
+                    hasher = None
                     if sha1:
-                        file_sha1 = await self.utils.calculate_sha1(dest)
-                        if file_sha1 != sha1:
-                            logger.error(f"SHA1校验失败: {dest},文件SHA1为{file_sha1},正确的为{sha1},下载链接为{url}")
-                            retry_count += 1
-                    logger.debug(f"文件下载成功: {dest}")
-                    return
+                        hasher = await hash_engine.hasher_for(part_path) if mode == 'ab' else hashlib.sha1()
+                    body_start = time.monotonic()
+                    nbytes = 0
+                    length = response.content_length
+                    if mode == 'wb' and length is not None and length <= self.SMALL_FILE_SIZE:
+                        # 小文件（如资源对象）整体读入内存，在一次线程往返内完成写盘
+                        body = await response.read()
+                        nbytes = len(body)
+                        self.progress.add_bytes(nbytes)
+                        if hasher: hasher.update(body)
+                        await asyncio.to_thread(self._write_small_file, part_path, body)
+                    else:
+                        async with aiofiles.open(part_path, mode) as file:
+                            while True:
+                                chunk = await response.content.read(1024 * 1024)
+                                if not chunk: break
+                                nbytes += len(chunk)
+                                self.progress.add_bytes(len(chunk))
+                                if hasher:
+                                    await asyncio.gather(file.write(chunk), hash_engine.update(hasher, chunk))
+                                else:
+                                    await file.write(chunk)
+                    elapsed = time.monotonic() - body_start
+                    self.progress.record_host(urlparse(source_url).hostname or "", nbytes, elapsed)
+                if sha1:
+                    file_sha1 = hasher.hexdigest()
+                    if file_sha1 != sha1:
+                        # 内容损坏：丢弃 .part 并计为该源的一次失败，下一轮从其他源（或从头）重新获取
+                        logger.error(f"SHA1校验失败: {dest},文件SHA1为{file_sha1},正确的为{sha1},下载链接为{source_url}")
+                        self.progress.sha1_failed(offset + nbytes)
+                        os.remove(part_path)
+                        raise ValueError(f"SHA1校验失败: {dest}")
+                self.endpoints.record_success(origin, latency, nbytes, elapsed)
+                self.endpoints.breaker.record_success(urlparse(source_url).netloc)
+                os.replace(part_path, dest)
+                if sha1:
+                    self.file_index.record(dest, sha1)
+                    await self._add_to_store(dest, sha1)
+                logger.debug("文件下载成功: %s", dest)
+                return
+            except asyncio.CancelledError:
+                # 读取响应体期间被取消（如 execute_plan 取消在途文件）：若这是半开探测，需放弃探测，否则该主机会一直被视为熔断
+                if source_url is not None: self.endpoints.breaker.cancel_probe(urlparse(source_url).netloc)
+                raise
             except Exception as e:
+                # 响应头之前的失败已在 _open 中计入熔断器，这里只处理读取响应体与校验阶段的失败
+                if source_url is not None: self.endpoints.breaker.record_failure(urlparse(source_url).netloc)
                 if hasattr(e, 'status') and hasattr(e, 'message'):
-                    logger.debug(f"下载失败: {url},错误码为{e.status},错误信息为{e.message}")
+                    logger.debug("下载失败: %s,错误码为%s,错误信息为%s", url, e.status, e.message)
                 else:
-                    logger.debug(f"下载失败: {url},错误信息为{e}")
+                    logger.debug("下载失败: %s,错误信息为%s", url, e)
                 retry_count += 1
-                wait_time = min(1 ** retry_count, 3)
-                await asyncio.sleep(wait_time)
                 if retry_count > max_retries:
                     logger.error(f"{dest}下载失败，已达到最大重试次数 {max_retries}")
                     raise e
+                all_origins = {candidate[0] for candidate in self.endpoints.candidates(url)}
+                if all_origins <= permanent:
+                    logger.error(f"{dest}下载失败，所有下载源均返回永久性错误: {e}")
+                    raise e
+                self.progress.retried()
+                if isinstance(e, CircuitOpenError):
+                    await asyncio.sleep(e.retry_after)
+                elif len(tried) < len(all_origins):
+                    # 还有未尝试过的源时立即切换
+                    continue
+                else:
+                    await asyncio.sleep(self.retry_policy.backoff(retry_count - 1, RetryPolicy.retry_after(e)))
 
-    async def download_log4j2(self, version_info, version):
-        if 'logging' in version_info:
-            log4j2_url = version_info['logging']['client']['file']['url']
-            if self.config['use_mirror']: log4j2_url = log4j2_url.replace("https://resources.download.minecraft.net", self.config['bmclapi_base_url'] + "/assets")
-            log4j2_path = os.path.join(self.config['minecraft_base_dir'], 'versions', version, 'log4j2.xml')
-            await self.download_file(log4j2_url, log4j2_path)
-
-    async def download_library(self, library, os_name, os_arch, version):
-        artifact = library.get('downloads', {}).get('artifact')
-        need_extract = False
-        library_path = None
-        if not self.utils.check_rules(library, os_name): return
-        classifiers = library.get('downloads', {}).get('classifiers')
-        if classifiers:
-            natives = library.get("natives")
-            if natives and os_name in natives:
-                native_classifier = natives[os_name].replace("${arch}", os_arch)
-            else:
-                native_classifier = f"natives-{os_name}"
-            for native, info in classifiers.items():
-                if native == native_classifier:
-                    artifact = info
-                    need_extract = True
-                    break
-        if artifact:
-            sha1 = artifact.get('sha1')
-            library_path = str(os.path.join(self.config['minecraft_base_dir'], 'libraries', artifact['path']))
-            library_url = artifact.get('url')
-            if self.config['use_mirror']: library_url = library_url.replace("https://libraries.minecraft.net", self.config['bmclapi_base_url'] + "/maven")
-            await self.download_file(library_url, library_path, sha1)
-            need_extract = need_extract or "natives" in library_url
-        if need_extract:
-            extract_path = str(os.path.join(self.config['minecraft_base_dir'], 'versions', version, f"{version}-natives"))
-            os.makedirs(extract_path, exist_ok=True)
-            if library_path is not None:
-                logger.debug(f"开始解压文件: {library_path} 到 {extract_path}")
-                await asyncio.to_thread(self.utils.sync_extract, library_path, extract_path)
-                logger.debug(f"文件解压完成: {library_path} 到 {extract_path}")
-
-    async def download_libraries(self, version_info, version, os_name, os_arch):
-        libraries = version_info.get('libraries', [])
-        tasks = [self.download_library(library, os_name, os_arch, version) for library in libraries]
-        await asyncio.gather(*tasks)
-
-    def replace_with_mirror(self, url):
-        if self.config['use_mirror']:
-            url = url.replace(self.config['resource_download_base_url'], self.config['bmclapi_base_url'] + '/assets')
-            url = url.replace("https://launcher.mojang.com", self.config['bmclapi_base_url'])
-        return url
-
-    async def download_assets(self, version_info):
-        asset_index_url = version_info.get('assetIndex', {}).get('url')
-        asset_index_url = self.replace_with_mirror(asset_index_url)
-        if asset_index_url:
-            asset_index_sha1 = version_info.get('assetIndex', {}).get('sha1')
-            asset_index_id = version_info.get('assets', '')
-            asset_index_path = os.path.join(self.config['minecraft_base_dir'], 'assets', 'indexes', f"{asset_index_id}.json")
-            await self.download_file(asset_index_url, asset_index_path, asset_index_sha1)
-            async with aiofiles.open(asset_index_path, 'r') as file:
-                asset_index = json.loads(await file.read())
-            tasks = []
-            for asset, info in asset_index.get('objects', {}).items():
+    @staticmethod
+    def _write_small_file(path, data):
+        with open(path, 'wb') as file:
+            file.write(data)
+
+    async def _add_to_store(self, path, sha1):
+        if self.config.get('use_content_store', True) and not os.path.exists(self.content_store.path_for(sha1)):
+            await asyncio.to_thread(self.content_store.add, path, sha1, self.file_index)
+
+    async def _open(self, candidates, headers, tried, permanent):
+        # 向首选源发出请求；开启对冲（hedge_delay > 0）时若迟迟收不到响应头，则向下一个源并发同样的请求，取先成功者
+        hedge_delay = self.config.get('hedge_delay', 0)
+        breaker = self.endpoints.breaker
+        queue = list(candidates)
+        pending = set()
+
+        async def attempt(origin, source_url, host):
+            slot = HostSlot()
+            try:
+                if self.scheduler: slot = await self.scheduler.host_slot(host)
+                start = time.monotonic()
+                response = await self.session.get(source_url, headers=headers)
+                if response.status >= 400 and response.status != 416:
+                    response.release()
+                    response.raise_for_status()
+            except asyncio.CancelledError:
+                slot.release()
+                breaker.cancel_probe(host)
+                raise
+            except Exception as e:
+                slot.release()
+                if RetryPolicy.trips_breaker(e):
+                    breaker.record_failure(host, RetryPolicy.retry_after(e))
+                else:
+                    breaker.record_success(host)
+                    permanent.add(origin)
+                raise
+            return origin, source_url, response, time.monotonic() - start, slot
+
+        def release_unused(task):
+            # 对冲中落败但已成功拿到响应的请求同样说明该主机可用；若它是半开探测，必须据此关闭熔断，否则该主机会一直被视为熔断
+            if not task.cancelled() and task.exception() is None:
+                _, source_url, response, _, slot = task.result()
+                response.release()
+                slot.release()
+                breaker.record_success(urlparse(source_url).netloc)
+
+        def launch():
+            # 跳过熔断中的主机；全部熔断时抛出 CircuitOpenError，由调用方等待最早恢复的主机
+            while queue:
+                origin, source_url = queue.pop(0)
+                host = urlparse(source_url).netloc
+                if breaker.allow(host):
+                    tried.add(origin)
+                    pending.add(asyncio.create_task(attempt(origin, source_url, host)))
+                    return True
+                blocked.append(host)
+            return False
+
+        blocked = []
+        if not launch():
+            host = min(blocked, key=breaker.wait_time)
+            raise CircuitOpenError(host, breaker.wait_time(host))
+        last_error = None
+        try:
+            while pending:
+                timeout = hedge_delay if hedge_delay and queue else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    logger.debug("请求超过 %s 秒未响应，向下一个下载源发起对冲请求", hedge_delay)
+                    launch()
+                    continue
+                pending.difference_update(done)
+                winner = None
+                for task in done:
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                    elif winner is None:
+                        winner = task.result()
+                    else:
+                        release_unused(task)
+                if winner is not None:
+                    return winner
+                if not pending and hedge_delay and queue:
+                    launch()
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+                task.add_done_callback(release_unused)
+
+    async def fetch_json(self, url, dest, sha1=None, offline=False):
+        data = self.metadata_cache.get(url, sha1)
+        if data is not None:
+            logger.debug("使用内存中的元数据: %s", url)
+            return data
+        if offline:
+            # 离线（dry-run）只读取本地副本，不发出任何网络请求
+            if not os.path.exists(dest):
+                raise FileNotFoundError(f"本地没有 {url} 的副本: {dest}")
+            if sha1 and not self.file_index.is_verified(dest, sha1) and await self.utils.calculate_sha1(dest) != sha1:
+                logger.warning(f"本地副本与 SHA1 不符，仍按其内容生成计划: {dest}")
+            return await read_json_file(dest)
+        if sha1:
+            # 已知 SHA1 时本地文件校验通过即可直接使用，无需任何网络请求
+            await self.download_file(url, dest, sha1)
+            data = await read_json_file(dest)
+        else:
+            data = await self._conditional_get_json(url, dest)
+        self.metadata_cache.remember(url, data, sha1)
+        return data
+
+    async def _conditional_get_json(self, url, dest):
+        headers = {}
+        if os.path.exists(dest):
+            validators = await self.metadata_cache.validators(url)
+            if validators.get("etag"): headers["If-None-Match"] = validators["etag"]
+            if validators.get("last_modified"): headers["If-Modified-Since"] = validators["last_modified"]
+        breaker = self.endpoints.breaker
+        tried = set()
+        permanent = set()
+        retry_count = 0
+        while True:
+            source_url = None
+            try:
+                candidates = [c for c in self.endpoints.candidates(url) if c[0] not in tried]
+                if not candidates:
+                    tried.clear()
+                    candidates = self.endpoints.candidates(url)
+                origin, source_url, response, latency, slot = await self._open(candidates, headers, tried, permanent)
+                async with slot, response:
+                    if response.status == 304:
+                        logger.debug("元数据未变化，使用本地缓存: %s", dest)
+                        data = await read_json_file(dest)
+                        body = None
+                    else:
+                        body = await response.read()
+                        data = json.loads(body)
+                        etag = response.headers.get("ETag")
+                        last_modified = response.headers.get("Last-Modified")
+                self.endpoints.record_success(origin, latency)
+                breaker.record_success(urlparse(source_url).netloc)
+                if body is None: return data
+                break
+            except asyncio.CancelledError:
+                if source_url is not None: breaker.cancel_probe(urlparse(source_url).netloc)
+                raise
+            except Exception as e:
+                if source_url is not None: breaker.record_failure(urlparse(source_url).netloc)
+                logger.debug("获取元数据失败: %s,错误信息为%s", url, e)
+                retry_count += 1
+                all_origins = {candidate[0] for candidate in self.endpoints.candidates(url)}
+                exhausted = len(tried) >= len(all_origins) or isinstance(e, CircuitOpenError)
+                # 所有源都失败过一轮后，有本地副本就先用本地副本，下次获取时再重新请求
+                if exhausted and os.path.exists(dest):
+                    logger.warning(f"获取 {url} 失败，使用本地缓存: {str(e)}")
+                    return await read_json_file(dest)
+                if retry_count > self.retry_policy.max_retries or all_origins <= permanent: raise
+                if isinstance(e, CircuitOpenError):
+                    await asyncio.sleep(e.retry_after)
+                elif exhausted:
+                    await asyncio.sleep(self.retry_policy.backoff(retry_count - 1, RetryPolicy.retry_after(e)))
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        async with aiofiles.open(dest + ".part", 'wb') as file:
+            await file.write(body)
+        os.replace(dest + ".part", dest)
+        await self.metadata_cache.save_validators(url, etag, last_modified)
+        return data
+
+    def resolve_artifacts(self, version_info, version, os_name, os_arch, asset_index=None):
+        # 一次性解析版本所需的全部文件：核心 jar、库（规则只判定一次，含 natives 分类器）、log4j2、资源索引与资源文件
+        base_dir = self.config['minecraft_base_dir']
+        artifacts = []
+        seen = set()
+
+        def add(url, path, sha1, size, priority, extract=False):
+            if not url or path in seen: return
+            seen.add(path)
+            artifacts.append({"url": url, "path": path, "sha1": sha1, "size": size or 0, "priority": priority, "extract": extract})
+
+        client = version_info.get('downloads', {}).get('client')
+        if client:
+            add(client.get('url'), os.path.join(base_dir, 'versions', version, f"{version}.jar"), client.get('sha1'), client.get('size'), DownloadScheduler.PRIORITY_CORE)
+        for _, artifact, native in self.utils.get_launch_plan(version_info, os_name, os_arch).libraries:
+            if artifact:
+                add(artifact.get('url'), os.path.join(base_dir, 'libraries', artifact['path']), artifact.get('sha1'), artifact.get('size'),
+                    DownloadScheduler.PRIORITY_CORE, extract="natives" in (artifact.get('url') or ""))
+            if native:
+                add(native.get('url'), os.path.join(base_dir, 'libraries', native['path']), native.get('sha1'), native.get('size'),
+                    DownloadScheduler.PRIORITY_CORE, extract=True)
+        log_file = version_info.get('logging', {}).get('client', {}).get('file')
+        if log_file:
+            add(log_file.get('url'), os.path.join(base_dir, 'versions', version, 'log4j2.xml'), log_file.get('sha1'), log_file.get('size'), DownloadScheduler.PRIORITY_LOG4J2)
+        index_info = version_info.get('assetIndex')
+        if index_info:
+            add(index_info.get('url'), self._asset_index_path(version_info), index_info.get('sha1'), index_info.get('size'), DownloadScheduler.PRIORITY_ASSETS)
+        if asset_index:
+            for info in asset_index.get('objects', {}).values():
                 asset_sha1 = info['hash']
-                asset_url = f"{self.config['resource_download_base_url']}/{asset_sha1[:2]}/{asset_sha1}"
-                asset_url = self.replace_with_mirror(asset_url)
-                asset_path = os.path.join(self.config['minecraft_base_dir'], 'assets', 'objects', asset_sha1[:2], asset_sha1)
-                tasks.append(self.download_file(asset_url, asset_path, asset_sha1))
-            await asyncio.gather(*tasks)
-
-    async def download_version(self, version_info, version, os_name, os_arch):
-        os.makedirs(os.path.join(self.config['minecraft_base_dir'], 'versions', version, f"{version}-natives"), exist_ok=True)
-        core_jar_url = version_info.get('downloads', {}).get('client', {}).get('url')
-        core_jar_url = self.replace_with_mirror(core_jar_url)
-        core_jar_path = os.path.join(self.config['minecraft_base_dir'], 'versions', version, f"{version}.jar")
-        core_jar_sha1 = version_info.get('downloads', {}).get('client', {}).get('sha1')
-        await asyncio.gather(
-            self.download_libraries(version_info, version, os_name, os_arch),
-            self.download_assets(version_info),
-            self.download_file(core_jar_url, core_jar_path, core_jar_sha1),
-            self.download_log4j2(version_info, version)
-        )
\ No newline at end of file
+                add(f"{self.config['resource_download_base_url']}/{asset_sha1[:2]}/{asset_sha1}",
+                    os.path.join(base_dir, 'assets', 'objects', asset_sha1[:2], asset_sha1), asset_sha1, info.get('size'), DownloadScheduler.PRIORITY_ASSETS)
+        return artifacts
+
+    def _asset_index_path(self, version_info):
+        return os.path.join(self.config['minecraft_base_dir'], 'assets', 'indexes', f"{version_info.get('assets', '')}.json")
+
+    async def _load_asset_index(self, version_info, offline=False):
+        index_info = version_info.get('assetIndex')
+        if not index_info: return None
+        asset_index_path = self._asset_index_path(version_info)
+        if offline:
+            if not os.path.exists(asset_index_path): return None
+        else:
+            await self.download_file(index_info['url'], asset_index_path, index_info.get('sha1'))
+        return await read_json_file(asset_index_path)
+
+    async def plan_version(self, version_info, version, os_name, os_arch, offline=False):
+        # 将解析出的文件与本地状态比对：缺失的需下载（或从共享仓库链接），校验不通过的需修复，其余跳过
+        asset_index = await self._load_asset_index(version_info, offline)
+        plan = InstallPlan(version)
+        plan.assets_resolved = asset_index is not None or 'assetIndex' not in version_info
+        use_store = self.config.get('use_content_store', True)
+        unverified = []
+        for artifact in self.resolve_artifacts(version_info, version, os_name, os_arch, asset_index):
+            path, sha1 = artifact['path'], artifact['sha1']
+            if artifact['extract']: plan.natives.append(artifact)
+            if not os.path.exists(path):
+                if sha1 and use_store and os.path.exists(self.content_store.path_for(sha1)): plan.link.append(artifact)
+                else: plan.fetch.append(artifact)
+            elif not sha1 or self.file_index.is_verified(path, sha1):
+                plan.skip.append(artifact)
+            else:
+                unverified.append(artifact)
+        mismatched = set(await hash_engine.verify_many([a['path'] for a in unverified], [a['sha1'] for a in unverified]))
+        for artifact in unverified:
+            if artifact['path'] in mismatched:
+                plan.repair.append(artifact)
+            else:
+                self.file_index.record(artifact['path'], artifact['sha1'])
+                plan.skip.append(artifact)
+        return plan
+
+    async def execute_plan(self, plan, version):
+        extract_path = str(os.path.join(self.config['minecraft_base_dir'], 'versions', version, f"{version}-natives"))
+        os.makedirs(extract_path, exist_ok=True)
+        max_concurrency = self.config.get('max_concurrent_downloads', 64)
+        max_per_host = self.config.get('max_connections_per_host', 16)
+        async with DownloadScheduler(max_concurrency, max_per_host) as scheduler:
+            self.scheduler = scheduler
+            try:
+                for artifact in plan.repair:
+                    logger.warning(f"文件校验失败，将重新下载: {artifact['path']}")
+                    os.remove(artifact['path'])
+                futures = {
+                    artifact['path']: self._submit(artifact['url'], artifact['path'], artifact['sha1'], artifact['priority'])
+                    for artifact in plan.link + plan.fetch + plan.repair
+                }
+                for future in futures.values(): future.add_done_callback(self.progress.file_done)
+
+                # natives 在对应 jar 下载完成后立即解压，与其余下载并行；来源 jar 均未变化时跳过
+                jars = {artifact['path']: artifact['sha1'] for artifact in plan.natives}
+                if jars and await asyncio.to_thread(self.natives_extractor.is_current, extract_path, jars):
+                    logger.debug("natives 未变化，跳过解压: %s", extract_path)
+                    jars = {}
+                elif jars:
+                    await asyncio.to_thread(self.natives_extractor.clear, extract_path)
+                extracted = []
+
+                async def extract(library_path):
+                    if library_path in futures:
+                        # jar 下载失败时已在下载结果中报告，这里不再重复
+                        try:
+                            await futures[library_path]
+                        except Exception:
+                            return False
+                    logger.debug("开始解压文件: %s 到 %s", library_path, extract_path)
+                    with tracer.span("extract_natives", jar=os.path.basename(library_path)):
+                        extracted.extend(await self.natives_extractor.extract(library_path, extract_path))
+                    logger.debug("文件解压完成: %s 到 %s", library_path, extract_path)
+                    return True
+
+                # 单个文件失败不中断整个安装：其余文件照常完成，最后统一报告失败的文件
+                results, extract_results = await asyncio.gather(
+                    asyncio.gather(*futures.values(), return_exceptions=True),
+                    asyncio.gather(*(extract(path) for path in jars), return_exceptions=True))
+                failed = [(path, result) for path, result in zip(futures, results) if isinstance(result, BaseException)]
+                failed += [(path, result) for path, result in zip(jars, extract_results) if isinstance(result, BaseException)]
+                # 只有全部 natives 都解压成功才写清单，否则下次会误判为已是最新
+                if jars and all(result is True for result in extract_results):
+                    await asyncio.to_thread(self.natives_extractor.write_manifest, extract_path, jars, extracted)
+                if failed:
+                    for path, error in failed: logger.error(f"文件下载失败: {path}: {error}")
+                    raise DownloadError(failed)
+            finally:
+                self.scheduler = None
+
+    async def download_version(self, version_info, version, os_name, os_arch, dry_run=False):
+        with tracer.span("download_version", version=version, dry_run=dry_run):
+            return await self._download_version(version_info, version, os_name, os_arch, dry_run)
+
+    async def _download_version(self, version_info, version, os_name, os_arch, dry_run=False):
+        with tracer.span("load_file_index"):
+            await asyncio.to_thread(self.file_index.load)
+        try:
+            with tracer.span("plan_version"):
+                plan = await self.plan_version(version_info, version, os_name, os_arch, offline=dry_run)
+            logger.info(plan.summary())
+            if dry_run:
+                for artifact in plan.repair: logger.info(f"  修复: {artifact['path']}")
+                for artifact in plan.fetch: logger.info(f"  下载: {artifact['path']} ({artifact['size']} 字节)")
+                for artifact in plan.link: logger.info(f"  链接: {artifact['path']}")
+                return plan
+            self.progress.begin(plan)
+            try:
+                with tracer.span("execute_plan", files=len(plan.fetch) + len(plan.link) + len(plan.repair)):
+                    await self.execute_plan(plan, version)
+            finally:
+                self.progress.finish()
+                metrics_file = self.config.get('download_metrics_file', os.path.join("QCL", "download_metrics.jsonl"))
+                if metrics_file: await asyncio.to_thread(self.progress.dump_json, metrics_file)
+            return plan
+        finally:
+            with tracer.span("flush_file_index"):
+                await asyncio.to_thread(self.file_index.flush)
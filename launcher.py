@@ -1,38 +1,303 @@
 import asyncio
+import collections
+import hashlib
+import json
+import locale
 import os
+import re
 import subprocess
 import sys
-from threading import Thread
-from typing import Callable, Optional
+from typing import Callable, Dict, List, Optional
 
-from utils import logger as logging, IUtils
+from utils import logger as logging, IUtils, read_json_file, tracer, write_json_file
 
 class ILauncher:
     async def get_args(self, version_info, version, version_isolation_enabled, config, utils: IUtils): pass
-    def execute_javaw_blocking(self, command: list, stdout_handler: Callable[[str], None], stderr_handler: Callable[[str], None], cwd: Optional[str]): pass
     async def launcher(self, version_info, version, version_cwd, version_isolation_enabled, config, utils: IUtils): pass
+    async def wait_for_games(self): pass
+
+class ArgumentTemplate:
+    # ${name} 占位符模板：每个参数只用预编译的正则扫描一次，替换值原样作为独立参数（含空格也无需加引号）
+    PLACEHOLDER = re.compile(r"\$\{([^}]+)\}")
+
+    def __init__(self, values: Dict[str, str], keep=()):
+        self.values = values
+        self.keep = set(keep)
+
+    def expand(self, args: List[str]) -> List[str]:
+        unknown = set()
+
+        def substitute(match):
+            name = match.group(1)
+            value = self.values.get(name)
+            if value is not None: return value
+            if name not in self.keep: unknown.add(name)
+            return match.group(0)
+
+        result = [self.PLACEHOLDER.sub(substitute, arg) if "${" in arg else arg for arg in args]
+        if unknown: logging.warning(f"启动参数中存在未知的占位符: {', '.join(sorted(unknown))}")
+        return result
+
+class CommandLine(tuple):
+    # 日志参数用：不可变，格式化推迟到日志监听线程，真正写日志时才拼接（类路径可能有上百项）
+    def __str__(self):
+        return " ".join(self)
+
+class GameProcess:
+    # 由 asyncio 管理的游戏进程：直接以参数列表启动 java，stdout/stderr 通过 lines() 以异步行迭代器提供
+    LINE_LIMIT = 1024 * 1024
+
+    def __init__(self, command: List[str], cwd: Optional[str] = None, name: Optional[str] = None, instance_id: int = 0):
+        self.command = command
+        self.cwd = cwd
+        self.name = name or os.path.basename(command[0])
+        self.instance_id = instance_id
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.returncode: Optional[int] = None
+        self.started = asyncio.Event()
+        self.exited = asyncio.Event()
+        self.crashed = asyncio.Event()
+        self._subscribers: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+
+    def __str__(self):
+        return f"[{self.instance_id}] {self.name}"
+
+    async def start(self):
+        kwargs = {"creationflags": subprocess.CREATE_NO_WINDOW} if sys.platform == "win32" else {}
+        self.process = await asyncio.create_subprocess_exec(
+            *self.command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, cwd=self.cwd, limit=self.LINE_LIMIT, **kwargs)
+        self.started.set()
+        logging.info(f"{self} 已启动，PID {self.process.pid}")
+        readers = [self._read(self.process.stdout, "stdout"), self._read(self.process.stderr, "stderr")]
+        self.add_task(self._supervise(readers))
+        return self
+
+    def add_task(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.append(task)
+        return task
+
+    async def _read(self, stream, name):
+        encoding = locale.getpreferredencoding(False)
+        while True:
+            try:
+                line = await stream.readline()
+            except ValueError:
+                # 单行超过 LINE_LIMIT：丢弃缓冲区中的这一段继续读取
+                line = await stream.read(self.LINE_LIMIT)
+            if not line: break
+            text = line.decode(encoding, errors="replace").rstrip()
+            for queue in self._subscribers: queue.put_nowait((name, text))
+
+    async def _supervise(self, readers):
+        await asyncio.gather(*readers)
+        self.returncode = await self.process.wait()
+        for queue in self._subscribers: queue.put_nowait(None)
+        if self.returncode != 0: self.crashed.set()
+        self.exited.set()
+
+    def subscribe(self) -> asyncio.Queue:
+        # 同步登记订阅：在 start() 返回后、让出事件循环之前调用，才能收到进程刚启动时的输出（快速崩溃的堆栈就在其中）
+        queue = asyncio.Queue()
+        self._subscribers.append(queue)
+        if self.exited.is_set(): queue.put_nowait(None)
+        return queue
+
+    async def lines(self, queue: Optional[asyncio.Queue] = None):
+        # 订阅之后的输出行，产出 (stream, line)，stream 为 "stdout" 或 "stderr"；进程退出后结束
+        # 传入 subscribe() 返回的队列时从登记那一刻开始接收，否则从首次迭代开始
+        queue = queue or self.subscribe()
+        try:
+            while (item := await queue.get()) is not None:
+                yield item
+        finally:
+            if queue in self._subscribers: self._subscribers.remove(queue)
+
+    async def wait(self) -> int:
+        await self.exited.wait()
+        return self.returncode
+
+    def terminate(self):
+        if self.process and self.returncode is None: self.process.terminate()
+
+class GameSupervisor:
+    # 管理同时运行的多个游戏实例
+    def __init__(self):
+        self.instances: Dict[int, GameProcess] = {}
+        self._next_id = 1
+
+    async def launch(self, command: List[str], cwd: Optional[str] = None, name: Optional[str] = None) -> GameProcess:
+        process = GameProcess(command, cwd=cwd, name=name, instance_id=self._next_id)
+        self._next_id += 1
+        await process.start()
+        self.instances[process.instance_id] = process
+        process.add_task(self._forget(process))
+        return process
+
+    async def _forget(self, process):
+        await process.wait()
+        self.instances.pop(process.instance_id, None)
+
+    @property
+    def running(self) -> List[GameProcess]:
+        return list(self.instances.values())
+
+    async def wait_all(self):
+        while self.instances:
+            process = next(iter(self.instances.values()))
+            await process.wait()
+            # 等待输出转发等附属任务结束
+            await asyncio.gather(*process._tasks, return_exceptions=True)
+
+class GameLogCapture:
+    # 游戏输出捕获：最近若干行保存在固定大小的环形缓冲区中，批量写入按实例轮转的日志文件；非零退出时提取崩溃摘要
+    CRASH_POINTER = re.compile(r"crash-reports[\\/]\S+\.txt|hs_err_pid\d+\.log")
+    EXCEPTION_START = re.compile(r"^(Exception in thread \S+ )?[\w$.]+(Exception|Error|Throwable)(: |$)")
+    STACK_LINE = re.compile(r"^\s+(at |\.\.\. \d+ more)|^Caused by: |^\s+Suppressed: ")
+    MAX_EXCERPT_LINES = 60
+
+    def __init__(self, process: GameProcess, log_dir=os.path.join("QCL", "logs"), max_lines=2000, max_bytes=5 * 1024 * 1024, backup_count=3, flush_interval=0.5, batch_size=256):
+        self.process = process
+        safe_name = re.sub(r"[^\w.-]", "_", process.name)
+        self.log_path = os.path.join(log_dir, f"{safe_name}-{process.instance_id}.log")
+        self.recent = collections.deque(maxlen=max_lines)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.crash_excerpt: Optional[str] = None
+        self._pending: List[str] = []
+        self._file = None
+        self._lock = asyncio.Lock()
+        self._stopping = asyncio.Event()
+        # 构造时即同步订阅，打开日志文件期间产生的输出也会在队列中等待
+        self._queue = process.subscribe()
+
+    async def run(self):
+        # 日志文件打不开（目录不可写、磁盘已满）时仍要继续消费队列：只保留环形缓冲区，否则输出会在队列中无限堆积
+        try:
+            await asyncio.to_thread(self._open)
+        except OSError as e:
+            logging.warning(f"{self.process} 的输出无法写入 {self.log_path}，仅保留最近 {self.recent.maxlen} 行: {e}")
+            self._file = None
+        flusher = asyncio.create_task(self._flush_periodically())
+        try:
+            async for stream, line in self.process.lines(self._queue):
+                text = line if stream == "stdout" else f"[STDERR] {line}"
+                self.recent.append(text)
+                self._pending.append(text)
+                if len(self._pending) >= self.batch_size: await self.flush()
+        finally:
+            # 不取消 flusher：取消无法中止线程中正在进行的写入，随后的 flush/close 会与之竞争；让它写完当前批次后自行退出
+            self._stopping.set()
+            await flusher
+            await self.flush()
+            if self._file: await asyncio.to_thread(self._file.close)
+        await self.process.wait()
+        if self.process.returncode:
+            self.crash_excerpt = self.extract_crash_excerpt(list(self.recent))
+            where = f"完整输出见 {self.log_path}" if os.path.exists(self.log_path) else "未能写入日志文件"
+            logging.error(f"{self.process} 异常退出（退出码 {self.process.returncode}），崩溃摘要:\n{self.crash_excerpt}\n{where}")
+
+    async def _flush_periodically(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def flush(self):
+        # 将积攒的行一次性交给线程写盘，事件循环不被磁盘 I/O 阻塞
+        async with self._lock:
+            if not self._pending: return
+            batch, self._pending = self._pending, []
+            if self._file is None: return
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except OSError as e:
+                # 写入失败（如磁盘已满）后不再写文件，输出仍进入环形缓冲区
+                logging.warning(f"写入 {self.log_path} 失败，停止记录 {self.process} 的输出文件: {e}")
+                file, self._file = self._file, None
+                if file: await asyncio.to_thread(self._close_quietly, file)
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+        if os.path.exists(self.log_path): self._rotate()
+        self._file = open(self.log_path, "a", encoding="utf-8")
+
+    def _rotate(self):
+        if self._file: self._file.close()
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.log_path}.{index}"
+            if os.path.exists(source): os.replace(source, f"{self.log_path}.{index + 1}")
+        if self.backup_count > 0: os.replace(self.log_path, f"{self.log_path}.1")
+        else: os.remove(self.log_path)
+        self._file = None
+
+    @staticmethod
+    def _close_quietly(file):
+        try:
+            file.close()
+        except OSError:
+            pass
+
+    def _write(self, batch):
+        if self._file.tell() >= self.max_bytes:
+            self._rotate()
+            self._file = open(self.log_path, "a", encoding="utf-8")
+        self._file.write("\n".join(batch) + "\n")
+        self._file.flush()
+
+    @classmethod
+    def extract_crash_excerpt(cls, lines: List[str]) -> str:
+        # 优先给出崩溃报告/hs_err 文件的位置和最后一个异常堆栈，找不到时退回到最后若干行输出
+        pointers = [line for line in lines if cls.CRASH_POINTER.search(line)]
+        blocks: List[List[str]] = []
+        for line in lines:
+            text = line[len("[STDERR] "):] if line.startswith("[STDERR] ") else line
+            if blocks and blocks[-1][-1] is not None and cls.STACK_LINE.match(text):
+                blocks[-1].append(line)
+            elif cls.EXCEPTION_START.match(text):
+                blocks.append([line])
+            elif blocks and blocks[-1][-1] is not None:
+                blocks[-1].append(None)
+        # 取最后一个带堆栈的异常，没有则取最后一个异常行
+        blocks = [[line for line in block if line is not None] for block in blocks]
+        block = next((b for b in reversed(blocks) if len(b) > 1), blocks[-1] if blocks else [])
+        excerpt = pointers[-3:] + block[:cls.MAX_EXCERPT_LINES]
+        if not excerpt: excerpt = lines[-20:]
+        return "\n".join(excerpt)
 
 class MinecraftLauncher(ILauncher):
+    PROFILE_NAME = "launch_profile.json"
+    PROFILE_FORMAT = 3
+    # 每次启动时才替换的认证相关占位符，不写入启动配置缓存
+    AUTH_PLACEHOLDERS = ("auth_player_name", "auth_uuid", "auth_access_token", "auth_session", "auth_xuid", "user_type")
+
+    def __init__(self):
+        self.supervisor = GameSupervisor()
+
     async def get_args(self, version_info, version, version_isolation_enabled, config, utils: IUtils, auth_info=None):
+        with tracer.span("get_args", version=version):
+            return await self._get_args(version_info, version, version_isolation_enabled, config, utils, auth_info)
+
+    async def _get_args(self, version_info, version, version_isolation_enabled, config, utils: IUtils, auth_info=None):
         # 认证/输入和 Java 检测并发进行，输入期间屏蔽 console 日志
         import logging as _logging
-        from utils import logger as qcl_logger
-        # 获取 console handler
-        console_handler = None
-        for h in qcl_logger.handlers:
-            if isinstance(h, _logging.StreamHandler):
-                console_handler = h
-                break
+        from utils import console_handler
         old_console_level = None
         if console_handler:
             old_console_level = console_handler.level
             console_handler.setLevel(_logging.CRITICAL + 1)  # 屏蔽所有 console 输出
         # 并发任务
-        java_task = asyncio.create_task(utils.async_find_java(config))
+        java_task = asyncio.create_task(tracer.traced("find_java", utils.async_find_java(config, version_info.get('javaVersion', {}).get("majorVersion"))))
         # 认证/输入
         if auth_info is None:
             from auth import perform_authentication
-            auth_info = await perform_authentication()
+            with tracer.span("authenticate"):
+                auth_info = await perform_authentication()
         username = auth_info.get("username", "QCLTEST")
         auth_uuid = auth_info.get("uuid", "6a058693-08f0-4404-b53f-c17bb3acea64")
         token = auth_info.get("access_token", "6a058693-08f0-4404-b53f-c17bb3acea64")
@@ -42,50 +307,66 @@ class MinecraftLauncher(ILauncher):
         version_directory = str(os.path.join(original_game_directory, "versions", version))
         natives_directory = os.path.join(original_game_directory, "versions", version, f"{version}-natives")
         game_directory = version_directory if version_isolation_enabled else original_game_directory
-        cp_task = asyncio.create_task(utils.get_cp(version_info, version, os_name, os_arch, version_directory, config))
         # 恢复 console handler 日志级别
         if console_handler and old_console_level is not None:
             console_handler.setLevel(old_console_level)
-        # 等待 Java 检测和 cp 结果
-        java_map = await java_task
-        cp = await cp_task
-        game_args = []
-        for arg in version_info.get('arguments', {}).get('game', []):
-            if isinstance(arg, str): game_args.append(arg)
-            elif isinstance(arg, dict):
-                if utils.check_rules(arg, os_name, os_arch, features={'is_demo_user': False, 'has_custom_resolution': False, 'has_quick_plays_support': False}):
-                    value = arg.get('value', [])
-                    if isinstance(value, list): game_args.extend(value)
-                    else: game_args.append(str(value))
-            else:
-                logging.error(f"非法参数类型: {type(arg)}")
-                raise ValueError(f"非法参数类型: {type(arg)}")
-        minecraft_arguments = version_info.get('minecraftArguments', '')
-        if minecraft_arguments: game_args.append(minecraft_arguments)
-        java_args = []
-        for arg in version_info.get('arguments', {}).get('jvm', []):
-            if isinstance(arg, str): java_args.append(arg)
-            elif isinstance(arg, dict):
-                if utils.check_rules(arg, os_name, os_arch):
-                    value = arg.get('value', [])
-                    if isinstance(value, list): java_args.extend(value)
-                    else: java_args.append(str(value))
-            else:
-                logging.error(f"非法参数类型: {type(arg)}")
-                raise ValueError(f"非法参数类型: {type(arg)}")
-        required_jvm_args = ["-XX:+UseG1GC", "-XX:-UseAdaptiveSizePolicy", "-XX:-OmitStackTraceInFastThrow", "-Djdk.lang.Process.allowAmbiguousCommands=true", "-Dfml.ignoreInvalidMinecraftCertificates=True", "-Dfml.ignorePatchDiscrepancies=True", "-Dlog4j2.formatMsgNoLookups=true", "-Djava.library.path=${natives_directory}", "-Djna.tmpdir=${natives_directory}", "-Dorg.lwjgl.system.SharedLibraryExtractPath=${natives_directory}", "-Dio.netty.native.workdir=${natives_directory}", "-cp ${classpath}"]
-        for arg in required_jvm_args:
-            if arg not in java_args: java_args.append(arg)
-        log_config = version_info.get('logging', {}).get('client', {})
-        log4j_arg = log_config.get('argument', '').replace("${path}", os.path.join(version_directory, "log4j2.xml")) if log_config else ""
-        replacements = {"${auth_player_name}": username, "${classpath}": cp, "${natives_directory}": natives_directory, "${launcher_name}": "MinecraftLauncher", "${launcher_version}": "1.0", "${version_name}": version, "${version_type}": version_info.get('type', 'release'), "${assets_root}": os.path.join(original_game_directory, "assets"), "${assets_index_name}": version_info.get('assets', 'legacy'), "${game_directory}": game_directory, "${auth_uuid}": auth_uuid, "${auth_access_token}": token, "${user_type}": auth_info.get("user_type", "msa")}
+        auth_values = {"auth_player_name": username, "auth_uuid": auth_uuid, "auth_access_token": token, "auth_session": token, "auth_xuid": auth_info.get("xuid", ""), "user_type": auth_info.get("user_type", "msa")}
+        # 等待 Java 检测结果
+        with tracer.span("wait_java"):
+            java_map = await java_task
+        java_path = self._select_java(java_map, version_info, os_name)
+        # 启动配置缓存：版本 JSON、Java 与相关配置都未变化时直接复用已解析的命令模板，只替换认证占位符
+        profile_path = os.path.join(version_directory, self.PROFILE_NAME)
+        with tracer.span("load_launch_profile"):
+            profile_key = self._profile_key(version_info, version, java_path, version_isolation_enabled, config, os_name, os_arch)
+            template = await self._load_profile(profile_path, profile_key)
+        if template is None:
+            with tracer.span("get_cp"):
+                cp = await utils.get_cp(version_info, version, os_name, os_arch, version_directory, config)
+            with tracer.span("build_template"):
+                template = self._build_template(version_info, version, java_path, cp, natives_directory, original_game_directory, game_directory, os_name, os_arch, utils)
+                await self._save_profile(profile_path, profile_key, template)
+        else:
+            logging.debug("使用缓存的启动配置: %s", profile_path)
+        # 记录替换认证信息之前的模板，访问令牌不会写入 debug.log
+        logging.debug("启动命令（认证占位符未展开）：%s", CommandLine(template))
+        with tracer.span("expand_auth"):
+            processed_command = ArgumentTemplate(auth_values).expand(template)
+        return processed_command
+
+    @staticmethod
+    def _profile_key(version_info, version, java_path, version_isolation_enabled, config, os_name, os_arch):
+        version_hash = hashlib.sha1(json.dumps(version_info, sort_keys=True).encode("utf-8")).hexdigest()
+        fields = [MinecraftLauncher.PROFILE_FORMAT, version, version_hash, java_path, os.path.abspath(config['minecraft_base_dir']), bool(version_isolation_enabled), os_name, os_arch]
+        return hashlib.sha1(json.dumps(fields).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    async def _load_profile(profile_path, profile_key):
+        if not os.path.exists(profile_path): return None
+        try:
+            profile = await read_json_file(profile_path)
+        except Exception as e:
+            logging.debug("读取启动配置缓存失败: %s", e)
+            return None
+        if profile.get("key") != profile_key: return None
+        return profile.get("command")
+
+    @staticmethod
+    async def _save_profile(profile_path, profile_key, template):
+        try:
+            await write_json_file(profile_path, {"key": profile_key, "command": template})
+        except OSError as e:
+            logging.debug("写入启动配置缓存失败: %s", e)
+
+    @staticmethod
+    def _select_java(java_map, version_info, os_name):
         required_java_version = str(version_info.get('javaVersion', {}).get("majorVersion", "21"))
         # 只在此处输出 info 级别 Java 检测结果
-        logging.debug(f"需要的Java版本: {required_java_version}")
+        logging.debug("需要的Java版本: %s", required_java_version)
         logging.debug("检测到的Java安装：")
         java_path = ""
         for path, ver in java_map.items():
-            logging.debug(f"  {ver.ljust(10)} : {path}")
+            logging.debug("  %-10s : %s", ver, path)
             if ver.replace("Java", "").strip() == required_java_version:
                 java_exe = "javaw.exe" if os_name == "windows" else "java"
                 candidate_path = os.path.join(path, java_exe)
@@ -99,48 +380,56 @@ class MinecraftLauncher(ILauncher):
             if latest_java:
                 java_path = os.path.join(latest_java[0], "javaw.exe" if os_name == "windows" else "java")
                 logging.info(f"使用最新Java: {java_path}")
+        return java_path
+
+    @staticmethod
+    def _build_template(version_info, version, java_path, cp, natives_directory, original_game_directory, game_directory, os_name, os_arch, utils: IUtils):
+        # 展开除认证信息以外的全部占位符，结果可跨启动复用
+        version_directory = str(os.path.join(original_game_directory, "versions", version))
+        # 规则已在启动计划中按平台判定过一次（与下载器、类路径共用）
+        plan = utils.get_launch_plan(version_info, os_name, os_arch)
+        game_args = list(plan.game_args)
+        java_args = list(plan.jvm_args)
+        required_jvm_args = ["-XX:+UseG1GC", "-XX:-UseAdaptiveSizePolicy", "-XX:-OmitStackTraceInFastThrow", "-Djdk.lang.Process.allowAmbiguousCommands=true", "-Dfml.ignoreInvalidMinecraftCertificates=True", "-Dfml.ignorePatchDiscrepancies=True", "-Dlog4j2.formatMsgNoLookups=true", "-Djava.library.path=${natives_directory}", "-Djna.tmpdir=${natives_directory}", "-Dorg.lwjgl.system.SharedLibraryExtractPath=${natives_directory}", "-Dio.netty.native.workdir=${natives_directory}"]
+        for arg in required_jvm_args:
+            if arg not in java_args: java_args.append(arg)
+        # 旧版本的 JSON 没有 jvm 参数，需要自行补上类路径（作为两个独立参数，路径含空格也无需引号）
+        if "${classpath}" not in java_args: java_args.extend(["-cp", "${classpath}"])
+        # 下载器按 SHA1 下载的 log4j2.xml（修复 Log4Shell 的官方配置），通过版本 JSON 给出的参数交给游戏
+        log_config = version_info.get('logging', {}).get('client', {})
+        log4j_arg = log_config.get('argument', '').replace("${path}", os.path.join(version_directory, "log4j2.xml")) if log_config.get('file') else ""
+        if log4j_arg and log4j_arg not in java_args: java_args.append(log4j_arg)
+        assets_root = os.path.join(original_game_directory, "assets")
+        values = {"classpath": cp, "classpath_separator": os.pathsep, "library_directory": os.path.join(original_game_directory, "libraries"), "natives_directory": natives_directory, "launcher_name": "MinecraftLauncher", "launcher_version": "1.0", "version_name": version, "version_type": version_info.get('type', 'release'), "assets_root": assets_root, "game_assets": assets_root, "assets_index_name": version_info.get('assets', 'legacy'), "game_directory": game_directory, "user_properties": "{}", "clientid": ""}
         command = [java_path]
         command.extend(java_args)
         command.append(version_info["mainClass"])
         command.extend(game_args)
-        processed_command = []
-        for part in command:
-            for key, value in replacements.items():
-                part = part.replace(key, value)
-            processed_command.append(part)
-        logging.debug("最终启动命令：" + " ".join(processed_command))
-        return processed_command
+        return ArgumentTemplate(values, keep=MinecraftLauncher.AUTH_PLACEHOLDERS).expand(command)
+
+    async def launcher(self, version_info, version, version_cwd, version_isolation_enabled, config, utils: IUtils, auth_info=None, stdout_handler: Optional[Callable[[str], None]] = None, stderr_handler: Optional[Callable[[str], None]] = None):
+        # 启动后立即返回 GameProcess，不等待游戏退出；输出写入日志文件，传入 handler 时才逐行转发
+        with tracer.span("launcher", version=version):
+            args = await self.get_args(version_info, version, version_isolation_enabled, config, utils, auth_info=auth_info)
+            with tracer.span("spawn"):
+                process = await self.supervisor.launch(args, cwd=version_cwd, name=version)
+        capture = GameLogCapture(process, log_dir=config.get('game_log_dir', os.path.join("QCL", "logs")), max_lines=config.get('game_log_buffer_lines', 2000))
+        process.capture = capture
+        process.add_task(capture.run())
+        logging.info(f"{process} 的输出写入 {capture.log_path}")
+
+        if stdout_handler or stderr_handler:
+            handlers = {"stdout": stdout_handler, "stderr": stderr_handler}
+            queue = process.subscribe()
+
+            async def forward_output():
+                async for stream, line in process.lines(queue):
+                    if handlers[stream]: handlers[stream](line)
+            process.add_task(forward_output())
+        return process
 
-    def execute_javaw_blocking(self, command: list, stdout_handler: Callable[[str], None] = lambda x: print(f"[STDOUT] {x}"), stderr_handler: Callable[[str], None] = lambda x: print(f"[STDERR] {x}"), cwd: Optional[str] = None):
-        qcl_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "QCL")
-        os.makedirs(qcl_dir, exist_ok=True)
-        bat_file_path = os.path.join(qcl_dir, "latest_start.bat")
-        with open(bat_file_path, 'w', encoding='utf-8') as f:
-            f.write("@echo off\n")
-            f.write(" ".join(command))
-        process = subprocess.Popen(bat_file_path, stdout=subprocess.PIPE, stderr=subprocess.PIPE, creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0, text=True, cwd=cwd)
-        def stream_reader(stream, handler):
-            while True:
-                try:
-                    line = stream.readline()
-                    if not line: break
-                    handler(line.rstrip())
-                except Exception as e:
-                    print(f"流读取错误: {e}")
-        stdout_thread = Thread(target=stream_reader, args=(process.stdout, stdout_handler))
-        stderr_thread = Thread(target=stream_reader, args=(process.stderr, stderr_handler))
-        stdout_thread.daemon = True
-        stderr_thread.daemon = True
-        stdout_thread.start()
-        stderr_thread.start()
-        process.wait()
-        stdout_thread.join()
-        stderr_thread.join()
-        process.stdout.close()
-        process.stderr.close()
-        return process.returncode
-
-    async def launcher(self, version_info, version, version_cwd, version_isolation_enabled, config, utils: IUtils, auth_info=None):
-        args = await self.get_args(version_info, version, version_isolation_enabled, config, utils, auth_info=auth_info)
-        exit_code = self.execute_javaw_blocking(args, cwd=version_cwd)
-        logging.info(f"进程退出码: {exit_code}")
\ No newline at end of file
+    async def wait_for_games(self):
+        # 游戏的输出管道由本进程持有，退出启动器前需等待仍在运行的实例结束
+        if self.supervisor.running:
+            logging.info(f"等待 {len(self.supervisor.running)} 个游戏实例退出...")
+            await self.supervisor.wait_all()
@@ -4,16 +4,25 @@ import os
 import shutil
 
 import aiofiles
-import aiohttp
 
-from utils import IConfigManager
-from downloader import IDownloader
+from utils import IConfigManager, http_client
+from downloader import IDownloader, DownloadError
 from launcher import ILauncher
 from utils import logger as logging, IUtils
 
-async def main(config_manager: IConfigManager, downloader: IDownloader, launcher: ILauncher, utils: IUtils):
-    observer = config_manager.start_config_watcher()
+def print_download_progress(event, snapshot):
+    # 在控制台同一行内刷新下载进度
+    from downloader import DownloadProgress
+    line = DownloadProgress.render_line(snapshot)
+    print("\r" + line.ljust(100), end="\n" if event == "finished" else "", flush=True)
+
+async def main(config_manager: IConfigManager, downloader: IDownloader, launcher: ILauncher, utils: IUtils, dry_run: bool = False):
     config = await config_manager.get_config()
+    observer = config_manager.start_config_watcher()
+    # 配置文件修改后自动推送新快照：下载器的镜像/重试设置与 Java 扫描设置即时生效
+    from utils import java_inventory
+    config_manager.subscribe(downloader.update_config)
+    config_manager.subscribe(java_inventory.on_config_changed)
     temp_path = os.path.join(config['minecraft_base_dir'], '.temp')
     if os.path.exists(temp_path):
         shutil.rmtree(temp_path)
@@ -23,69 +32,96 @@ async def main(config_manager: IConfigManager, downloader: IDownloader, launcher
     user_manager = UserManager("QCL/users.ini")
     await user_manager.user_load()
     refresh_task = None
+    http_client.configure(limit=config.get('max_concurrent_downloads', 64), limit_per_host=config.get('max_connections_per_host', 16))
+    downloader.session = await http_client.get_session()  # 整个应用生命周期共用一个 session
     while True:
-        user_choice = input("请输入你想要的操作:\n1. 下载\n2. 启动\n3. 设置\n4. 退出\n")
-        connector = aiohttp.TCPConnector(limit_per_host=1024)
-        async with aiohttp.ClientSession(connector=connector) as session:
-            downloader.session = session  # 设置 session
-            version_manifest_url = config['version_manifest_url']
-            version_manifest_path = config['version_manifest_path']
-            if user_choice == "1":
-                logging.info("开始下载版本清单")
-                await downloader.download_file(version_manifest_url, version_manifest_path)
-                async with aiofiles.open(version_manifest_path, 'r') as file:
-                    version_manifest = json.loads(await file.read())
-                latest_release = version_manifest['latest']['release']
-                latest_snapshot = version_manifest['latest']['snapshot']
-                versions = {version['id']: version['url'] for version in version_manifest['versions']}
-                logging.info(f"最新发布版本: {latest_release}")
-                logging.info(f"最新快照版本: {latest_snapshot}")
-                selected_version = input("请输入要下载的版本: ")
-                if selected_version not in versions:
-                    logging.error("无效的版本号")
-                    continue
-                version_info_url = versions[selected_version]
-                version_info_path = os.path.join(config['minecraft_base_dir'], 'versions', selected_version, f"{selected_version}.json")
-                logging.info(f"开始下载版本 {selected_version} 的信息")
-                await downloader.download_file(version_info_url, version_info_path)
-                async with aiofiles.open(version_info_path, 'r') as file:
-                    version_info = json.loads(await file.read())
-                logging.info(f"开始下载版本 {selected_version} 的所有文件")
-                await downloader.download_version(version_info, selected_version, os_name, os_arch)
-            elif user_choice == "2":
-                # 启动前自动刷新账户（异步并发，不阻塞输入）
-                if refresh_task is None or refresh_task.done():
-                    refresh_task = asyncio.create_task(user_manager.refresh_all_users(AuthManager()))
-                versions = os.listdir(os.path.join(config['minecraft_base_dir'], 'versions'))
-                version = input(f"请输入要启动的版本: {versions}\n")
-                version_info_path = os.path.join(config['minecraft_base_dir'], 'versions', version, f"{version}.json")
-                original_game_directory = os.path.abspath(config['minecraft_base_dir'])
-                version_directory = os.path.join(original_game_directory, "versions", version)
-                version_isolation_enabled = config["version_isolation_enabled"]
-                if version_isolation_enabled:
-                    version_cwd = os.path.abspath(version_directory)
+        # 在线程中等待输入，游戏运行、账户刷新等后台任务不会因此停顿
+        user_choice = await asyncio.to_thread(input, "请输入你想要的操作:\n1. 下载\n2. 启动\n3. 设置\n4. 退出\n")
+        config = config_manager.config or config
+        version_manifest_url = config['version_manifest_url']
+        version_manifest_path = config['version_manifest_path']
+        if user_choice == "1":
+            try:
+                if dry_run:
+                    # dry-run 不联网：版本清单与版本 JSON 都读取本地副本
+                    logging.info("读取本地版本清单")
                 else:
-                    qcl_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "QCL")
-                    os.makedirs(qcl_dir, exist_ok=True)
-                    version_cwd = qcl_dir
-                async with aiofiles.open(version_info_path, 'r') as file:
-                    version_info = json.loads(await file.read())
-                logging.info(f"开始启动版本 {version}")
-                await launcher.launcher(version_info, version, version_cwd, version_isolation_enabled, config, utils)
-            elif user_choice == "3":
-                # 登录/认证前等待刷新完成
-                if refresh_task is not None and not refresh_task.done():
-                    logging.info("等待账户刷新完成...")
-                    await refresh_task
-                await config_manager.settings()
-            elif user_choice == "4":
-                break
+                    logging.info("开始下载版本清单")
+                version_manifest = await downloader.fetch_json(version_manifest_url, version_manifest_path, offline=dry_run)
+            except FileNotFoundError as e:
+                logging.error(f"dry-run 需要已下载的版本清单: {e}")
+                continue
+            latest_release = version_manifest['latest']['release']
+            latest_snapshot = version_manifest['latest']['snapshot']
+            versions = {version['id']: version for version in version_manifest['versions']}
+            logging.info(f"最新发布版本: {latest_release}")
+            logging.info(f"最新快照版本: {latest_snapshot}")
+            selected_version = await asyncio.to_thread(input, "请输入要下载的版本: ")
+            if selected_version not in versions:
+                logging.error("无效的版本号")
+                continue
+            version_entry = versions[selected_version]
+            version_info_path = os.path.join(config['minecraft_base_dir'], 'versions', selected_version, f"{selected_version}.json")
+            logging.info(f"读取版本 {selected_version} 的本地信息" if dry_run else f"开始下载版本 {selected_version} 的信息")
+            try:
+                version_info = await downloader.fetch_json(version_entry['url'], version_info_path, version_entry.get('sha1'), offline=dry_run)
+            except FileNotFoundError as e:
+                logging.error(f"dry-run 需要已下载的版本信息: {e}")
+                continue
+            logging.info(f"开始下载版本 {selected_version} 的所有文件")
+            downloader.progress.subscribe(print_download_progress)
+            try:
+                await downloader.download_version(version_info, selected_version, os_name, os_arch, dry_run=dry_run)
+            except DownloadError as e:
+                logging.error(f"版本 {selected_version} 未完整安装，请稍后重新下载: {e}")
+            finally:
+                downloader.progress.unsubscribe(print_download_progress)
+        elif user_choice == "2":
+            # 启动前自动刷新账户（异步并发，不阻塞输入）
+            if refresh_task is None or refresh_task.done():
+                refresh_task = asyncio.create_task(user_manager.refresh_all_users(AuthManager()))
+            versions = os.listdir(os.path.join(config['minecraft_base_dir'], 'versions'))
+            version = await asyncio.to_thread(input, f"请输入要启动的版本: {versions}\n")
+            version_info_path = os.path.join(config['minecraft_base_dir'], 'versions', version, f"{version}.json")
+            original_game_directory = os.path.abspath(config['minecraft_base_dir'])
+            version_directory = os.path.join(original_game_directory, "versions", version)
+            version_isolation_enabled = config["version_isolation_enabled"]
+            if version_isolation_enabled:
+                version_cwd = os.path.abspath(version_directory)
             else:
-                logging.error("无效的选择，请重新输入。")
-    observer.stop()
-    observer.join()
+                qcl_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "QCL")
+                os.makedirs(qcl_dir, exist_ok=True)
+                version_cwd = qcl_dir
+            async with aiofiles.open(version_info_path, 'r') as file:
+                version_info = json.loads(await file.read())
+            logging.info(f"开始启动版本 {version}")
+            await launcher.launcher(version_info, version, version_cwd, version_isolation_enabled, config, utils)
+        elif user_choice == "3":
+            # 登录/认证前等待刷新完成
+            if refresh_task is not None and not refresh_task.done():
+                logging.info("等待账户刷新完成...")
+                await refresh_task
+            await config_manager.settings()
+        elif user_choice == "4":
+            break
+        else:
+            logging.error("无效的选择，请重新输入。")
+    await launcher.wait_for_games()
+    await http_client.close()
+    if observer:
+        observer.stop()
+        observer.join()
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dry-run", action="store_true", help="下载时只打印安装计划（需下载/修复/跳过的文件），不联网下载任何文件")
+    parser.add_argument("--trace", nargs="?", const="QCL/trace.json", default=None, help="记录各阶段耗时，退出时写出 Chrome trace 时间线（默认 QCL/trace.json）")
+    parser.add_argument("--profile", nargs="?", const="QCL/profile.prof", default=None, help="用 cProfile 记录本次运行，退出时写出统计文件（默认 QCL/profile.prof）")
+    cli_args = parser.parse_args()
+    from utils import tracer
+    if cli_args.trace or cli_args.profile:
+        tracer.enable(trace_file=cli_args.trace, profile_file=cli_args.profile)
     from utils import ConfigManager
     from downloader import DownloadClass
     from launcher import MinecraftLauncher
@@ -96,4 +132,7 @@ if __name__ == "__main__":
     launcher = MinecraftLauncher()
     utils = Utils()
     # 日志初始化已由 utils.py 统一管理
-    asyncio.run(main(config_manager, downloader, launcher, utils))
\ No newline at end of file
+    try:
+        asyncio.run(main(config_manager, downloader, launcher, utils, dry_run=cli_args.dry_run))
+    finally:
+        tracer.dump()
\ No newline at end of file
@@ -11,6 +11,7 @@ import json
 import aiofiles
 import psutil
 from pathlib import Path
+from types import MappingProxyType
 import logging
 from logging.handlers import RotatingFileHandler
 
@@ -21,88 +22,229 @@ class IConfigManager:
     async def save_config(self, config): pass
     async def settings(self): pass
     def start_config_watcher(self): pass
+    def subscribe(self, callback): pass
+
+
+def freeze_config(value):
+    # 配置快照只读：dict 转为 MappingProxyType，list 转为 tuple，订阅者之间共享同一份对象也不会被意外修改
+    if isinstance(value, (dict, MappingProxyType)):
+        return MappingProxyType({key: freeze_config(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze_config(item) for item in value)
+    return value
+
+
+def thaw_config(value):
+    if isinstance(value, (dict, MappingProxyType)):
+        return {key: thaw_config(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw_config(item) for item in value]
+    return value
+
 
 class ConfigManager(IConfigManager):
-    _config_cache = None
-    _last_modified_time = None
-    _config_lock = asyncio.Lock()
     PROJECT_ROOT = Path(__file__).parent
+    CONFIG_PATH = PROJECT_ROOT / "QCL" / "config.json"
+    RELOAD_DELAY = 0.2
+    DEFAULT_CONFIG = {
+        "version_manifest_url": "https://piston-meta.mojang.com/mc/game/version_manifest_v2.json",
+        "version_manifest_path": ".minecraft/version_manifest.json",
+        "resource_download_base_url": "https://resources.download.minecraft.net",
+        "bmclapi_base_url": "https://bmclapi2.bangbang93.com",
+        "minecraft_base_dir": ".minecraft",
+        "java_executables": ["javaw.exe", "java.exe"],
+        "keywords": ["java", "jdk", "jre", "oracle", "minecraft", "runtime"],
+        "ignore_dirs": ["windows", "system32", "temp"],
+        "version_isolation_enabled": True,
+        "use_mirror": False,
+        "max_concurrent_downloads": 64,
+        "max_connections_per_host": 16,
+        "metadata_cache_ttl": 600,
+        "use_content_store": True,
+        "content_store_dir": "QCL/store",
+    }
+
+    def __init__(self):
+        self._config = None
+        self._subscribers = []
+        self._loop = None
+        self._reload_timer = None
+
+    @property
+    def config(self):
+        # 当前配置快照；整体替换而非原地修改，读取无需加锁
+        return self._config
+
+    def subscribe(self, callback):
+        # callback(new_config, old_config) 在事件循环线程中调用
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    @classmethod
+    def validate(cls, data):
+        # 必须是 JSON 对象，且已知字段的类型与默认配置一致；缺失的字段用默认值补齐
+        if not isinstance(data, dict):
+            raise ValueError("配置文件顶层必须是 JSON 对象")
+        for key, default in cls.DEFAULT_CONFIG.items():
+            if key in data and not isinstance(data[key], type(default)):
+                raise ValueError(f"配置项 {key} 的类型应为 {type(default).__name__}")
+        return {**cls.DEFAULT_CONFIG, **data}
+
+    def _apply(self, data):
+        snapshot = freeze_config(data)
+        if snapshot == self._config:
+            return
+        old, self._config = self._config, snapshot
+        if old is None:
+            return
+        logger.info("配置已更新")
+        for callback in list(self._subscribers):
+            try:
+                callback(snapshot, old)
+            except Exception as e:
+                logger.error(f"配置订阅者处理出错: {str(e)}")
 
     async def get_config(self):
-        async with self._config_lock:
-            config_path = self.PROJECT_ROOT / "QCL" / "config.json"
-            if self._config_cache and os.path.getmtime(config_path) == self._last_modified_time:
-                return self._config_cache
-            if config_path.exists():
-                try:
-                    self._config_cache = await read_json_file(str(config_path))
-                    self._last_modified_time = os.path.getmtime(config_path)
-                    return self._config_cache
-                except Exception as e:
-                    logger.error(f"读取配置文件出错: {str(e)}")
-                    return None
-            else:
-                logger.warning("配置文件不存在，将使用默认配置")
-                default_config = {
-                    "version_manifest_url": "https://piston-meta.mojang.com/mc/game/version_manifest.json",
-                    "version_manifest_path": ".minecraft/version_manifest.json",
-                    "resource_download_base_url": "https://resources.download.minecraft.net",
-                    "bmclapi_base_url": "https://bmclapi2.bangbang93.com",
-                    "minecraft_base_dir": ".minecraft",
-                    "java_executables": ["javaw.exe", "java.exe"],
-                    "keywords": ["java", "jdk", "jre", "oracle", "minecraft", "runtime"],
-                    "ignore_dirs": ["windows", "system32", "temp"],
-                    "version_isolation_enabled": True,
-                    "use_mirror": False,
-                }
-                ensure_dir_exists(str(config_path.parent))
-                await write_json_file(str(config_path), default_config)
-                self._config_cache = default_config
-                self._last_modified_time = os.path.getmtime(config_path)
-                return default_config
+        if self._config is not None:
+            return self._config
+        config_path = self.CONFIG_PATH
+        if config_path.exists():
+            try:
+                self._apply(self.validate(await read_json_file(str(config_path))))
+                return self._config
+            except Exception as e:
+                logger.error(f"读取配置文件出错: {str(e)}")
+                return None
+        logger.warning("配置文件不存在，将使用默认配置")
+        await self.save_config(self.DEFAULT_CONFIG)
+        return self._config
 
     async def save_config(self, config):
-        config_path = self.PROJECT_ROOT / "QCL" / "config.json"
-        await write_json_file(str(config_path), config)
-        await asyncio.sleep(0.1)
-        self._config_cache = config
-        self._last_modified_time = os.path.getmtime(config_path)
+        # 先写临时文件再原子替换，监视器不会读到写了一半的文件
+        config = thaw_config(config)
+        config_path = str(self.CONFIG_PATH)
+        ensure_dir_exists(os.path.dirname(config_path))
+        await write_json_file(config_path + ".tmp", config)
+        os.replace(config_path + ".tmp", config_path)
+        self._apply(config)
 
     async def settings(self):
-        config = await self.get_config()
+        config = thaw_config(await self.get_config())
         print("当前版本隔离状态: ", "开启" if config["version_isolation_enabled"] else "关闭")
-        choice = input("是否开启版本隔离？(y/n): ").strip().lower()
+        # 在线程中等待输入，避免阻塞事件循环（游戏输出读取等后台任务仍在运行）
+        choice = (await asyncio.to_thread(input, "是否开启版本隔离？(y/n): ")).strip().lower()
         if choice == 'y': config["version_isolation_enabled"] = True
         elif choice == 'n': config["version_isolation_enabled"] = False
         print("当前是否使用镜像源: ", "是" if config["use_mirror"] else "否")
-        choice = input("是否使用镜像源？(y/n): ").strip().lower()
+        choice = (await asyncio.to_thread(input, "是否使用镜像源？(y/n): ")).strip().lower()
         if choice == 'y': config["use_mirror"] = True
         elif choice == 'n': config["use_mirror"] = False
         await self.save_config(config)
 
+    def _schedule_reload(self):
+        # 在 watchdog 线程中调用：合并短时间内的多次事件，稍后统一重新读取
+        if self._reload_timer is not None:
+            self._reload_timer.cancel()
+        self._reload_timer = threading.Timer(self.RELOAD_DELAY, self._reload)
+        self._reload_timer.daemon = True
+        self._reload_timer.start()
+
+    def _reload(self):
+        config_path = self.CONFIG_PATH
+        if not config_path.exists():
+            logger.warning("配置文件已被删除，继续使用当前配置")
+            return
+        try:
+            with open(config_path, "r", encoding="utf-8") as f:
+                data = self.validate(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.warning(f"配置文件无效，继续使用当前配置: {str(e)}")
+            return
+        self._loop.call_soon_threadsafe(self._apply, data)
+
     def start_config_watcher(self):
-        # 可选：如需热更新功能可在此实现
-        pass
+        # 基于 watchdog（Linux 上为 inotify）监视配置文件，修改后自动校验并推送新的配置快照；返回 Observer
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            logger.warning("未安装 watchdog，配置热更新不可用")
+            return None
+        self._loop = asyncio.get_running_loop()
+        manager = self
+        config_name = self.CONFIG_PATH.name
+
+        class ConfigEventHandler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                # 只关心写入类事件；新版 watchdog 会上报 opened 事件，读取配置本身不应再次触发重载
+                if event.event_type not in ("modified", "created", "moved", "deleted", "closed"):
+                    return
+                paths = [getattr(event, "src_path", ""), getattr(event, "dest_path", "")]
+                if any(os.path.basename(str(path)) == config_name for path in paths):
+                    manager._schedule_reload()
+
+        ensure_dir_exists(str(self.CONFIG_PATH.parent))
+        observer = Observer()
+        observer.schedule(ConfigEventHandler(), str(self.CONFIG_PATH.parent), recursive=False)
+        observer.daemon = True
+        observer.start()
+        return observer
+
+
 import asyncio
+import contextvars
+import cProfile
 import hashlib
+import mmap
 import os
 import platform
 import re
 import shutil
+import sqlite3
 import struct
+import threading
+import time
 import zipfile
-from typing import Dict, Set, List
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from typing import Dict, Set, List, Optional
 import json
 import aiofiles
+import aiohttp
 import psutil
 
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+
+class _LazyQueueHandler(QueueHandler):
+    # 标准 QueueHandler.prepare 会在调用方线程里格式化消息；这里原样入队，%-style 参数留给监听线程格式化
+    MUTABLE_ARGS = (list, dict, set, bytearray)
+
+    def prepare(self, record):
+        # 参数是可变容器时立即格式化，避免监听线程看到之后被修改的内容
+        if isinstance(record.args, dict) or (
+            record.args and any(isinstance(arg, self.MUTABLE_ARGS) for arg in record.args)
+        ):
+            record.msg = record.getMessage()
+            record.args = None
+        # 入队时就决定是否输出到控制台，临时屏蔽控制台期间的日志不会在恢复后才被打印
+        record.qcl_console = console_handler is None or record.levelno >= console_handler.level
+        return record
 
 
 def setup_logger():
+    # 日志调用只把 LogRecord 放入队列，磁盘与控制台写入都在 QueueListener 的后台线程中完成，不阻塞事件循环
+    global console_handler, log_listener
     qcl_logger = logging.getLogger("QCL")
     qcl_logger.setLevel(logging.DEBUG)
+    if qcl_logger.hasHandlers():
+        return qcl_logger
     log_dir = "QCL"
     log_file = os.path.join(log_dir, "debug.log")
     old_log_file = os.path.join(log_dir, "log.old")
@@ -122,25 +264,124 @@ def setup_logger():
     console_formatter = logging.Formatter("%(message)s")
     console_handler.setFormatter(console_formatter)
     console_handler.setLevel(logging.INFO)
-    if not qcl_logger.hasHandlers():
-        qcl_logger.addHandler(file_handler)
-        qcl_logger.addHandler(console_handler)
+    console_handler.addFilter(lambda record: getattr(record, "qcl_console", True))
+    log_queue = queue.SimpleQueue()
+    log_listener = QueueListener(
+        log_queue, file_handler, console_handler, respect_handler_level=True
+    )
+    log_listener.start()
+    atexit.register(log_listener.stop)
+    qcl_logger.addHandler(_LazyQueueHandler(log_queue))
     return qcl_logger
 
 
+# 控制台输出 handler（由 QueueListener 调用），可调整其级别临时屏蔽控制台日志
+console_handler: Optional[logging.Handler] = None
+log_listener: Optional[QueueListener] = None
+
+
 logger = setup_logger()
 
 
+class Tracer:
+    # 轻量级分段计时：span 的父子关系记录在 contextvars 中，asyncio 任务创建时继承当前 span，并发时也能正确嵌套
+    # 默认关闭（span 几乎无开销）；enable 后在 dump 时写出 Chrome trace（chrome://tracing 或 Perfetto 打开），可选同时输出 cProfile
+    def __init__(self):
+        self.enabled = False
+        self.trace_file = None
+        self.profile_file = None
+        self._events: List[Dict] = []
+        self._current = contextvars.ContextVar("qcl_span", default=None)
+        self._tracks: Dict[int, int] = {}
+        self._next_span = 1
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._profiler = None
+
+    def enable(self, trace_file=None, profile_file=None):
+        self.enabled = True
+        self.trace_file = trace_file
+        self.profile_file = profile_file
+        if profile_file:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def _track(self):
+        # 每个 asyncio 任务（或线程）一行，便于在时间线上看出并发
+        try:
+            key = id(asyncio.current_task())
+        except RuntimeError:
+            key = threading.get_ident()
+        with self._lock:
+            return self._tracks.setdefault(key, len(self._tracks) + 1)
+
+    @contextmanager
+    def span(self, name, **args):
+        if not self.enabled:
+            yield
+            return
+        parent = self._current.get()
+        with self._lock:
+            span_id = self._next_span
+            self._next_span += 1
+        token = self._current.set((span_id, name))
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            self._current.reset(token)
+            event = {
+                "name": name,
+                "ph": "X",
+                "ts": round((start - self._origin) * 1e6, 1),
+                "dur": round(duration * 1e6, 1),
+                "pid": os.getpid(),
+                "tid": self._track(),
+                "args": dict(args, span_id=span_id, parent=parent[1] if parent else None),
+            }
+            with self._lock:
+                self._events.append(event)
+            logger.debug("[trace] %s: %.1f ms", name, duration * 1000)
+
+    async def traced(self, name, awaitable, **args):
+        # 用于 asyncio.create_task(tracer.traced("...", coro))：在任务内部计时
+        with self.span(name, **args):
+            return await awaitable
+
+    def dump(self):
+        if not self.enabled:
+            return
+        if self._profiler:
+            self._profiler.disable()
+            ensure_dir_exists(os.path.dirname(self.profile_file) or ".")
+            self._profiler.dump_stats(self.profile_file)
+            logger.info(f"cProfile 结果已写入 {self.profile_file}")
+        if self.trace_file:
+            with self._lock:
+                events = list(self._events)
+            ensure_dir_exists(os.path.dirname(self.trace_file) or ".")
+            with open(self.trace_file, "w", encoding="utf-8") as f:
+                json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+            logger.info(f"时间线已写入 {self.trace_file}")
+
+
+tracer = Tracer()
+
+
 class IUtils:
     def check_rules(self, element, os_name, os_arch=None, features=None):
         pass
 
+    def get_launch_plan(self, version_info, os_name, os_arch, features=None):
+        pass
+
     async def get_cp(
         self, version_info, version, os_name, os_arch, version_directory, config
     ):
         pass
 
-    async def async_find_java(self, config):
+    async def async_find_java(self, config, required_version=None):
         pass
 
     async def get_os_info(self):
@@ -156,72 +397,204 @@ class IUtils:
         pass
 
 
-class Utils(IUtils):
-    def check_rules(self, element, os_name, os_arch=None, features=None):
-        rules = element.get("rules", [])
-        if not rules:
-            return True
+class LaunchPlan:
+    # 版本 JSON 针对某一平台 (os, arch, features) 解析后的结果：库、natives 分类器构件与启动参数
+    def __init__(self, version_id, os_name, os_arch, features):
+        self.version_id = version_id
+        self.os_name = os_name
+        self.os_arch = os_arch
+        self.features = features
+        # 每项为 (库条目, 主构件或 None, 当前平台的 natives 构件或 None)，顺序与版本 JSON 一致
+        self.libraries: List[tuple] = []
+        self.jvm_args: List[str] = []
+        self.game_args: List[str] = []
+
+    @property
+    def natives(self) -> List[Dict]:
+        return [native for _, _, native in self.libraries if native]
+
+
+class CompiledRules:
+    # 预编译的规则列表：os.version 正则只编译一次，求值时不再逐层解析字典
+    def __init__(self, rules):
+        self.rules = []
         for rule in rules:
             os_cond = rule.get("os", {})
-            feature_cond = rule.get("features", {})
-            action = rule.get("action", "allow")
-            os_match = True
-            if "name" in os_cond and os_cond["name"] != os_name:
-                os_match = False
-            if "arch" in os_cond and os_cond.get("arch") not in (None, os_arch):
-                os_match = False
-            feature_match = True
-            if features is not None:
-                for feat_key, feat_val in feature_cond.items():
-                    if features.get(feat_key) != feat_val:
-                        feature_match = False
-            if os_match and feature_match:
-                return action == "allow"
-        return False
+            version = os_cond.get("version")
+            self.rules.append((
+                rule.get("action", "allow") == "allow",
+                os_cond.get("name"),
+                normalize_arch(os_cond["arch"]) if os_cond.get("arch") else None,
+                re.compile(version) if version else None,
+                tuple(rule.get("features", {}).items()),
+            ))
+
+    def evaluate(self, os_name, os_arch=None, os_version=None, features=None) -> bool:
+        if not self.rules:
+            return True
+        allowed = False
+        for allow, name, arch, version, feature_cond in self.rules:
+            if name is not None and name != os_name:
+                continue
+            if arch is not None and arch != os_arch:
+                continue
+            if version is not None and (os_version is None or not version.search(os_version)):
+                continue
+            if features is not None and any(features.get(key) != value for key, value in feature_cond):
+                continue
+            allowed = allow
+        return allowed
+
+
+def normalize_arch(arch):
+    # 规则中的 "x86" 表示 32 位；统一为 get_os_info 的 "32"/"64"/"arm64"
+    arch = str(arch).lower()
+    if arch in ("x86", "i386", "i686", "32"):
+        return "32"
+    if arch in ("x64", "x86_64", "amd64", "64"):
+        return "64"
+    if arch in ("arm64", "aarch64"):
+        return "arm64"
+    return arch
+
+
+def current_os_version():
+    # 与 Java 的 os.version 对应，用于匹配规则中的 os.version 正则
+    system = platform.system().lower()
+    if system == "windows":
+        return platform.version()
+    if system == "darwin":
+        return platform.mac_ver()[0]
+    return platform.release()
+
+
+class Utils(IUtils):
+    DEFAULT_FEATURES = {
+        "is_demo_user": False,
+        "has_custom_resolution": False,
+        "has_quick_plays_support": False,
+        "is_quick_play_singleplayer": False,
+        "is_quick_play_multiplayer": False,
+        "is_quick_play_realms": False,
+    }
+    # (版本 id, os, arch, features) -> (version_info, LaunchPlan)，下载器、类路径与启动参数共用
+    _launch_plans: Dict[tuple, tuple] = {}
+
+    def check_rules(self, element, os_name, os_arch=None, features=None):
+        return CompiledRules(element.get("rules", [])).evaluate(
+            os_name,
+            normalize_arch(os_arch) if os_arch else None,
+            current_os_version(),
+            features,
+        )
+
+    def get_launch_plan(self, version_info, os_name, os_arch, features=None):
+        os_arch = normalize_arch(os_arch)
+        features = dict(features if features is not None else self.DEFAULT_FEATURES)
+        key = (version_info.get("id"), os_name, os_arch, tuple(sorted(features.items())))
+        cached = self._launch_plans.get(key)
+        if cached and (cached[0] is version_info or cached[0] == version_info):
+            return cached[1]
+        plan = self._compile_launch_plan(version_info, os_name, os_arch, features)
+        self._launch_plans[key] = (version_info, plan)
+        return plan
+
+    @staticmethod
+    def _compile_launch_plan(version_info, os_name, os_arch, features):
+        plan = LaunchPlan(version_info.get("id"), os_name, os_arch, features)
+        os_version = current_os_version()
+
+        def allowed(element, element_features=None):
+            return CompiledRules(element.get("rules", [])).evaluate(
+                os_name, os_arch, os_version, element_features
+            )
 
-    async def get_cp(
-        self, version_info, version, os_name, os_arch, version_directory, config
-    ):
-        cp = ""
         for library in version_info.get("libraries", []):
-            if not self.check_rules(library, os_name):
+            if not allowed(library, features):
                 continue
-            artifact = library.get("downloads", {}).get("artifact")
-            if artifact:
-                lib_path = str(
-                    os.path.join(
-                        config["minecraft_base_dir"], "libraries", artifact["path"]
-                    )
-                    + ";"
-                )
-                cp += os.path.abspath(lib_path)
-            classifiers = library.get("downloads", {}).get("classifiers")
+            downloads = library.get("downloads", {})
+            artifact = downloads.get("artifact")
+            native = None
+            classifiers = downloads.get("classifiers")
             if classifiers:
                 natives = library.get("natives", {})
                 if os_name in natives:
                     native_classifier = natives[os_name].replace("${arch}", os_arch)
                 else:
                     native_classifier = f"natives-{os_name}"
-                if native_classifier in classifiers:
-                    info = classifiers[native_classifier]
-                    lib_path = str(
-                        os.path.join(
-                            config["minecraft_base_dir"], "libraries", info["path"]
-                        )
-                        + ";"
-                    )
-                    cp += os.path.abspath(lib_path)
-        main_jar_path = os.path.join(version_directory, f"{version}.jar")
-        main_jar_path = os.path.abspath(main_jar_path)
-        cp += main_jar_path
-        return f'"{cp}"'
-
-    async def async_find_java(self, config):
-        java_executables = config["java_executables"]
+                native = classifiers.get(native_classifier)
+            plan.libraries.append((library, artifact, native))
+
+        def collect(args, target, element_features):
+            for arg in args:
+                if isinstance(arg, str):
+                    target.append(arg)
+                elif isinstance(arg, dict):
+                    if allowed(arg, element_features):
+                        value = arg.get("value", [])
+                        if isinstance(value, list):
+                            target.extend(value)
+                        else:
+                            target.append(str(value))
+                else:
+                    logger.error(f"非法参数类型: {type(arg)}")
+                    raise ValueError(f"非法参数类型: {type(arg)}")
+
+        arguments = version_info.get("arguments", {})
+        collect(arguments.get("game", []), plan.game_args, features)
+        collect(arguments.get("jvm", []), plan.jvm_args, None)
+        minecraft_arguments = version_info.get("minecraftArguments", "")
+        if minecraft_arguments:
+            plan.game_args.extend(minecraft_arguments.split())
+        return plan
+
+    async def get_cp(
+        self, version_info, version, os_name, os_arch, version_directory, config
+    ):
+        base_dir = os.path.abspath(os.path.join(config["minecraft_base_dir"], "libraries"))
+        entries: List[str] = []
+        seen: Set[str] = set()
+        plan = self.get_launch_plan(version_info, os_name, os_arch)
+        for _, artifact, native in plan.libraries:
+            for info in filter(None, (artifact, native)):
+                lib_path = os.path.join(base_dir, info["path"])
+                if lib_path not in seen:
+                    seen.add(lib_path)
+                    entries.append(lib_path)
+        entries.append(os.path.abspath(os.path.join(version_directory, f"{version}.jar")))
+        # 作为独立参数传给 java，无需引号；分隔符随平台（Windows 为 ;，其余为 :）
+        return os.pathsep.join(entries)
+
+    async def async_find_java(self, config, required_version=None):
+        # 先用缓存的 Java 清单（只做 stat 复核）。清单为空时才阻塞等待全盘扫描；
+        # 缺少所需版本或扫描设置变化时在后台重新扫描（新安装的 JDK 下次启动即可用），本次先用缓存中最接近的运行时
+        await asyncio.to_thread(java_inventory.load)
+        await self._probe_java_many(java_inventory.revalidate())
+        if not java_inventory.has_suitable():
+            logger.debug("Java 清单为空，开始扫描")
+            await asyncio.gather(java_inventory.start_scan(self._full_scan_java(config)), return_exceptions=True)
+        elif java_inventory.has_suitable(required_version) and not java_inventory.rescan_requested:
+            logger.debug("使用缓存的 Java 清单")
+        else:
+            logger.debug("缓存中没有 Java %s（或扫描设置已变化），在后台重新扫描", required_version)
+            java_inventory.start_scan(self._full_scan_java(config))
+        await asyncio.to_thread(java_inventory.save)
+        return java_inventory.version_map()
+
+    async def _full_scan_java(self, config):
+        try:
+            await self._scan_java(config)
+        finally:
+            await asyncio.to_thread(java_inventory.save)
+
+    async def _scan_java(self, config):
+        java_executables = set(config["java_executables"])
+        if os.name != "nt":
+            java_executables.add("java")
         keywords = config["keywords"]
         ignore_dirs = config["ignore_dirs"]
         scanned_paths: Set[str] = set()
-        java_versions: Dict[str, str] = {}
+        discovered: List[tuple] = []
 
         async def safe_scandir(dir_path: str) -> List[os.DirEntry]:
             try:
@@ -232,7 +605,7 @@ class Utils(IUtils):
             except (PermissionError, FileNotFoundError, NotADirectoryError):
                 return []
             except Exception as e:
-                logger.debug(f"Scan error in {dir_path}: {str(e)}")
+                logger.debug("Scan error in %s: %s", dir_path, e)
                 return []
 
         async def scan_path(dir_path: str, depth: int = 0) -> None:
@@ -250,47 +623,15 @@ class Utils(IUtils):
                         parent_dir = os.path.dirname(entry_path)
                         if parent_dir not in scanned_paths:
                             scanned_paths.add(parent_dir)
-                            version = await get_java_version(parent_dir)
-                            java_versions[parent_dir] = version
-                            logger.debug(f"Found Java {version} at {parent_dir}")
+                            if not java_inventory.is_known(parent_dir):
+                                discovered.append((parent_dir, entry_path))
                         continue
                     if entry.is_dir() and not entry.name.startswith("."):
                         dir_name = entry.name.lower()
                         if any(kw in dir_name for kw in keywords) or depth < 2:
                             await scan_path(str(entry_path), depth + 1)
             except Exception as e:
-                logger.debug(f"Error processing {dir_path}: {str(e)}")
-
-        async def get_java_version(java_dir: str) -> str:
-            java_exe = os.path.join(java_dir, "java.exe")
-            if not os.path.exists(java_exe):
-                return "unknown"
-            try:
-                proc = await asyncio.create_subprocess_exec(
-                    java_exe,
-                    "-version",
-                    stdout=asyncio.subprocess.PIPE,
-                    stderr=asyncio.subprocess.PIPE,
-                )
-                stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=5)
-                output = (stderr or stdout).decode("utf-8", errors="ignore").lower()
-                version_match = re.search(
-                    r'version "(\d+)(?:\.\d+)?(?:\.[\d_]+)?(?:-[a-zA-Z0-9]+)?"', output
-                )
-                if version_match:
-                    major_version = version_match.group(1)
-                    if major_version == "1":
-                        minor_match = re.search(r'"1\.(\d+)\.', output)
-                        if minor_match:
-                            return f"Java {minor_match.group(1)}"
-                        else:
-                            return "Java 8"
-                    return f"Java {major_version}"
-            except (asyncio.TimeoutError, FileNotFoundError):
-                return "timeout"
-            except Exception as e:
-                logger.debug(f"Version check failed: {str(e)}")
-            return "unknown"
+                logger.debug("Error processing %s: %s", dir_path, e)
 
         scan_tasks = []
         for env_var in ["PATH", "JAVA_HOME"]:
@@ -311,7 +652,88 @@ class Utils(IUtils):
             scan_tasks.append(scan_path(path))
 
         await asyncio.gather(*scan_tasks)
-        return java_versions
+        await self._probe_java_many(discovered)
+
+    async def _probe_java_many(self, runtimes: List[tuple], max_concurrency: int = 8):
+        # 扫描结束后再统一探测，有界并发；大多数运行时只需读取 release 文件
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def probe(java_dir, executable):
+            async with semaphore:
+                info = await self._probe_java(java_dir)
+            java_inventory.update(java_dir, executable, info)
+            logger.debug("Found Java %s at %s", info['version'], java_dir)
+
+        await asyncio.gather(*(probe(java_dir, executable) for java_dir, executable in runtimes))
+
+    @staticmethod
+    def _read_java_release(java_dir: str) -> Optional[Dict]:
+        # JDK/JRE 根目录下的 release 文件，如 JAVA_VERSION="17.0.8"、OS_ARCH="x86_64"、IMPLEMENTOR="Eclipse Adoptium"
+        home = os.path.dirname(java_dir)
+        for candidate in (home, os.path.dirname(home)):
+            release_path = os.path.join(candidate, "release")
+            try:
+                with open(release_path, "r", encoding="utf-8", errors="ignore") as f:
+                    text = f.read()
+            except OSError:
+                continue
+            fields = dict(re.findall(r'^([A-Z_]+)="?(.*?)"?\s*$', text, re.MULTILINE))
+            version = fields.get("JAVA_VERSION", "")
+            version_match = re.match(r"(?:1\.)?(\d+)", version)
+            if not version_match:
+                continue
+            os_arch = fields.get("OS_ARCH", "").lower()
+            if os_arch in ("x86_64", "amd64", "x64"):
+                arch = "64"
+            elif os_arch in ("aarch64", "arm64"):
+                arch = "arm64"
+            elif os_arch:
+                arch = "32"
+            else:
+                arch = "unknown"
+            major = int(version_match.group(1))
+            return {"version": f"Java {major}", "major": major, "arch": arch, "vendor": fields.get("IMPLEMENTOR", "unknown")}
+        return None
+
+    async def _probe_java(self, java_dir: str) -> Dict:
+        info = await asyncio.to_thread(self._read_java_release, java_dir)
+        if info:
+            return info
+        # 没有 release 文件时才启动 java -version
+        info = {"version": "unknown", "major": None, "arch": "unknown", "vendor": "unknown"}
+        java_exe = os.path.join(java_dir, "java.exe" if os.name == "nt" else "java")
+        if not os.path.exists(java_exe):
+            return info
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                java_exe,
+                "-version",
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=5)
+            raw_output = (stderr or stdout).decode("utf-8", errors="ignore")
+            output = raw_output.lower()
+            version_match = re.search(
+                r'version "(\d+)(?:\.\d+)?(?:\.[\d_]+)?(?:-[a-zA-Z0-9]+)?"', output
+            )
+            if version_match:
+                major_version = version_match.group(1)
+                if major_version == "1":
+                    minor_match = re.search(r'"1\.(\d+)\.', output)
+                    major_version = minor_match.group(1) if minor_match else "8"
+                info["major"] = int(major_version)
+                info["version"] = f"Java {major_version}"
+            info["arch"] = "64" if "64-bit" in output else "32"
+            # 第二行形如 "OpenJDK Runtime Environment Temurin-17.0.8+7 (build ...)"
+            lines = raw_output.strip().splitlines()
+            if len(lines) > 1:
+                info["vendor"] = lines[1].split("(build")[0].strip()
+        except (asyncio.TimeoutError, FileNotFoundError):
+            info["version"] = "timeout"
+        except Exception as e:
+            logger.debug("Version check failed: %s", e)
+        return info
 
     async def get_os_info(self):
         os_name = platform.system().lower()
@@ -356,15 +778,27 @@ class Utils(IUtils):
             logger.error(f"检查架构时出错: {str(e)}")
             return False
 
+    @staticmethod
+    def _read_native_header(source):
+        # 只读取判定架构所需的头部：ELF 看前 64 字节，PE 还需读到 e_lfanew 指向的 COFF 头
+        header = source.read(64)
+        if header[:2] == b"MZ" and len(header) >= 0x40:
+            pe_offset = struct.unpack("<I", header[0x3C:0x40])[0]
+            if pe_offset + 6 > len(header):
+                header += source.read(pe_offset + 6 - len(header))
+        return header
+
     def sync_extract(self, library_path, extract_path):
+        # 单次遍历：每个成员只解压一次，先流式读出头部判定架构，保留的成员直接接着写出剩余内容
         system_arch = platform.architecture()[0]
         if "64" in system_arch:
             required_arch = "64"
         else:
             required_arch = "32"
+        extracted = []
         with zipfile.ZipFile(library_path, "r") as zip_ref:
-            filtered_members = []
-            for member in zip_ref.namelist():
+            for info in zip_ref.infolist():
+                member = info.filename
                 skip_reasons = []
                 if member.startswith("META-INF/"):
                     skip_reasons.append("签名文件")
@@ -372,43 +806,464 @@ class Utils(IUtils):
                     skip_reasons.append("空目录")
                 if "LICENSE" in member.upper():
                     skip_reasons.append("许可证文件")
-                if not skip_reasons:
-                    try:
-                        file_content = zip_ref.read(member)
-                        if not self.check_library_arch_from_content(
-                            file_content, required_arch
-                        ):
-                            skip_reasons.append("架构不匹配")
-                    except Exception as e:
-                        logger.error(f"检查 {member} 架构时出错: {str(e)}")
-                        skip_reasons.append("架构检查出错")
                 if skip_reasons:
-                    logger.debug(f"跳过文件 {member}，原因: {', '.join(skip_reasons)}")
+                    logger.debug("跳过文件 %s，原因: %s", member, ', '.join(skip_reasons))
+                    continue
+                target_path = os.path.join(extract_path, os.path.basename(member))
+                try:
+                    with zip_ref.open(info) as source:
+                        header = self._read_native_header(source)
+                        if not self.check_library_arch_from_content(header, required_arch):
+                            logger.debug("跳过文件 %s，原因: 架构不匹配", member)
+                            continue
+                        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                        with open(target_path, "wb") as target:
+                            target.write(header)
+                            shutil.copyfileobj(source, target)  # type:ignore
+                except Exception as e:
+                    logger.error(f"解压 {member} 时出错: {str(e)}")
                     continue
-                else:
-                    logger.debug(f"保留文件 {member}")
-                filtered_members.append(member)
-            logger.debug(f"过滤完成,保留{filtered_members}")
-            for member in filtered_members:
-                file_name = os.path.basename(member)
-                target_path = os.path.join(extract_path, file_name)
-                os.makedirs(os.path.dirname(target_path), exist_ok=True)
-                with zip_ref.open(member) as source, open(target_path, "wb") as target:
-                    shutil.copyfileobj(source, target)  # type:ignore
                 if os.name != "nt":
-                    file_info = zip_ref.getinfo(member)
-                    os.chmod(target_path, file_info.external_attr >> 16)
+                    mode = info.external_attr >> 16
+                    if mode:
+                        os.chmod(target_path, mode)
+                logger.debug("保留文件 %s", member)
+                extracted.append(os.path.basename(member))
+        return extracted
 
     async def calculate_sha1(self, file_path: str) -> str:
+        return await hash_engine.hash_file(file_path)
+
+
+class HashEngine:
+    # 在有界线程池中计算 SHA1：hashlib 处理大块数据时会释放 GIL，整块读取或 mmap 避免每 8 KiB 一次线程往返
+    MMAP_THRESHOLD = 4 * 1024 * 1024
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or min(8, (os.cpu_count() or 1) + 2)
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="qcl-hash"
+            )
+        return self._executor
+
+    @classmethod
+    def hash_file_sync(cls, file_path: str) -> str:
         sha1 = hashlib.sha1()
-        async with aiofiles.open(file_path, "rb") as f:
-            while True:
-                chunk = await f.read(8192)
-                if not chunk:
-                    break
-                sha1.update(chunk)
+        with open(file_path, "rb") as f:
+            if os.fstat(f.fileno()).st_size > cls.MMAP_THRESHOLD:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    sha1.update(mm)
+            else:
+                sha1.update(f.read())
         return sha1.hexdigest()
 
+    @staticmethod
+    def _hasher_for_sync(file_path: str):
+        sha1 = hashlib.sha1()
+        with open(file_path, "rb") as f:
+            while chunk := f.read(HashEngine.MMAP_THRESHOLD):
+                sha1.update(chunk)
+        return sha1
+
+    async def hasher_for(self, file_path: str):
+        # 返回已读入 file_path 全部内容的 sha1 对象，供续传时继续更新
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._get_executor(), self._hasher_for_sync, file_path
+        )
+
+    async def update(self, hasher, data: bytes):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._get_executor(), hasher.update, data)
+
+    async def hash_file(self, file_path: str) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._get_executor(), self.hash_file_sync, file_path
+        )
+
+    async def verify_many(self, paths: List[str], expected: List[str]) -> List[str]:
+        # 返回 SHA1 不匹配（或无法读取）的文件路径，顺序与 paths 一致
+        async def check(path, sha1):
+            try:
+                return await self.hash_file(path) == sha1
+            except OSError:
+                return False
+
+        results = await asyncio.gather(
+            *(check(path, sha1) for path, sha1 in zip(paths, expected))
+        )
+        return [path for path, ok in zip(paths, results) if not ok]
+
+
+hash_engine = HashEngine()
+
+
+class ContentStore:
+    # 按 SHA1 寻址的全局文件仓库：各 .minecraft 目录通过硬链接（跨设备时尝试 reflink，最后才复制）共享同一份内容
+    FICLONE = 0x40049409
+
+    def __init__(self, root=os.path.join("QCL", "store")):
+        self.root = root
+        # 无法与仓库建立链接的源文件所在设备；这些设备上的文件不再尝试入库
+        self._unlinkable_devices = set()
+
+    def path_for(self, sha1):
+        return os.path.join(self.root, sha1[:2], sha1)
+
+    @classmethod
+    def _reflink(cls, src, dst):
+        import fcntl
+
+        with open(src, "rb") as source, open(dst, "wb") as target:
+            fcntl.ioctl(target.fileno(), cls.FICLONE, source.fileno())
+
+    @classmethod
+    def link_file(cls, src, dst, allow_copy=True):
+        # 先链接到临时名再原子替换，避免目标目录里出现半成品；allow_copy 为 False 时无法链接则抛出 OSError
+        tmp = dst + ".link"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+        try:
+            os.link(src, tmp)
+        except OSError as link_error:
+            try:
+                cls._reflink(src, tmp)
+            except (OSError, ImportError):
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                if not allow_copy:
+                    raise link_error
+                shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+
+    def materialize(self, sha1, dest, file_index) -> bool:
+        store_path = self.path_for(sha1)
+        if not os.path.exists(store_path):
+            return False
+        if not file_index.is_verified(store_path, sha1):
+            if HashEngine.hash_file_sync(store_path) != sha1:
+                logger.warning(f"共享仓库中的文件已损坏，已移除: {store_path}")
+                os.remove(store_path)
+                return False
+            file_index.record(store_path, sha1)
+        self.link_file(store_path, dest)
+        file_index.record(dest, sha1)
+        return True
+
+    def add(self, path, sha1, file_index):
+        # 入库只允许硬链接或 reflink：跨卷时复制一份会让磁盘占用翻倍，此时直接跳过（复制仅用于 materialize）
+        store_path = self.path_for(sha1)
+        if os.path.exists(store_path):
+            return
+        device = None
+        try:
+            device = os.stat(path).st_dev
+            if device in self._unlinkable_devices:
+                return
+            self.link_file(path, store_path, allow_copy=False)
+            file_index.record(store_path, sha1)
+        except (FileExistsError, FileNotFoundError) as e:
+            logger.debug("加入共享仓库失败: %s,错误信息为%s", path, e)
+        except OSError as e:
+            # 跨卷或文件系统不支持链接：同一设备上的其他文件也会失败，本次会话内不再尝试
+            self._unlinkable_devices.add(device)
+            logger.debug("无法链接到共享仓库，跳过该设备上的文件: %s,错误信息为%s", path, e)
+
+
+class NativesExtractor:
+    # 在专用线程池中并行解压各 natives jar；目录中的清单记录了来源 jar 的 SHA1 与解压出的文件，匹配时整体跳过
+    MANIFEST_NAME = ".natives.json"
+
+    def __init__(self, utils, max_workers=None):
+        self.utils = utils
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="qcl-natives"
+            )
+        return self._executor
+
+    def _manifest_path(self, extract_path):
+        return os.path.join(extract_path, self.MANIFEST_NAME)
+
+    def _read_manifest(self, extract_path):
+        try:
+            with open(self._manifest_path(extract_path), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _jar_hashes(jars: Dict[str, str]) -> Dict[str, str]:
+        # 版本 JSON 未给出 SHA1 的 jar 现场计算
+        return {
+            os.path.normpath(path): sha1 or HashEngine.hash_file_sync(path)
+            for path, sha1 in jars.items()
+        }
+
+    def is_current(self, extract_path, jars: Dict[str, str]) -> bool:
+        manifest = self._read_manifest(extract_path)
+        if not manifest:
+            return False
+        try:
+            if manifest.get("jars") != self._jar_hashes(jars):
+                return False
+        except OSError:
+            return False
+        return all(
+            os.path.exists(os.path.join(extract_path, name))
+            for name in manifest.get("files", [])
+        )
+
+    def clear(self, extract_path):
+        # 来源 jar 变化时先删除上次解压出的文件，避免残留旧版本的库
+        manifest = self._read_manifest(extract_path)
+        if not manifest:
+            return
+        for name in manifest.get("files", []):
+            try:
+                os.remove(os.path.join(extract_path, name))
+            except OSError:
+                pass
+        try:
+            os.remove(self._manifest_path(extract_path))
+        except OSError:
+            pass
+
+    def write_manifest(self, extract_path, jars: Dict[str, str], files: List[str]):
+        manifest = {"jars": self._jar_hashes(jars), "files": sorted(set(files))}
+        tmp = self._manifest_path(extract_path) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp, self._manifest_path(extract_path))
+
+    async def extract(self, library_path, extract_path) -> List[str]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._get_executor(), self.utils.sync_extract, library_path, extract_path
+        )
+
+
+class HttpClient:
+    # 应用生命周期内共享的 HTTP 客户端：下载器与各验证步骤复用同一个连接池、keep-alive 连接与 DNS 缓存
+    def __init__(self, limit=64, limit_per_host=16):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self._session = None
+
+    def configure(self, limit=None, limit_per_host=None):
+        # 仅对之后新建的连接池生效
+        if limit is not None:
+            self.limit = limit
+        if limit_per_host is not None:
+            self.limit_per_host = limit_per_host
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=300,
+                keepalive_timeout=60,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=60),
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+http_client = HttpClient()
+
+
+class VerifiedFileIndex:
+    # 记录已校验文件的 (size, mtime_ns, inode, sha1)，stat 未变化时无需重新计算哈希
+    def __init__(self, db_path=os.path.join("QCL", "verified_files.db")):
+        self.db_path = db_path
+        self._entries: Dict[str, tuple] = {}
+        self._dirty: Dict[str, tuple] = {}
+        self._loaded = False
+
+    @staticmethod
+    def _ensure_schema(conn):
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER, sha1 TEXT)"
+        )
+
+    @staticmethod
+    def _stat(path):
+        st = os.stat(path)
+        return st.st_size, st.st_mtime_ns, st.st_ino
+
+    def load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if not os.path.exists(self.db_path):
+            return
+        try:
+            with closing(sqlite3.connect(self.db_path)) as conn:
+                self._ensure_schema(conn)
+                for path, size, mtime_ns, inode, sha1 in conn.execute(
+                    "SELECT path, size, mtime_ns, inode, sha1 FROM files"
+                ):
+                    self._entries[path] = (size, mtime_ns, inode, sha1)
+            logger.debug("已加载校验索引: %s 条记录", len(self._entries))
+        except sqlite3.Error as e:
+            logger.warning(f"读取校验索引失败，将重新校验所有文件: {str(e)}")
+            self._entries = {}
+
+    def is_verified(self, path, sha1) -> bool:
+        self.load()
+        entry = self._entries.get(os.path.abspath(path))
+        if entry is None or entry[3] != sha1:
+            return False
+        try:
+            return self._stat(path) == entry[:3]
+        except OSError:
+            return False
+
+    def record(self, path, sha1):
+        self.load()
+        try:
+            entry = (*self._stat(path), sha1)
+        except OSError:
+            return
+        key = os.path.abspath(path)
+        self._entries[key] = entry
+        self._dirty[key] = entry
+
+    def flush(self):
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        ensure_dir_exists(os.path.dirname(self.db_path) or ".")
+        try:
+            with closing(sqlite3.connect(self.db_path)) as conn:
+                self._ensure_schema(conn)
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO files (path, size, mtime_ns, inode, sha1) VALUES (?, ?, ?, ?, ?)",
+                        [(path, *entry) for path, entry in dirty.items()],
+                    )
+        except sqlite3.Error as e:
+            logger.warning(f"写入校验索引失败: {str(e)}")
+
+
+class JavaInventory:
+    # 持久化的 Java 运行时清单：记录路径、主版本、架构、厂商与可执行文件的 mtime，启动时只需 stat 复核
+    def __init__(self, cache_file=os.path.join("QCL", "java_inventory.json")):
+        self.cache_file = cache_file
+        self._entries: Dict[str, Dict] = {}
+        self._loaded = False
+        self._dirty = False
+        # 扫描设置（java_executables/keywords/ignore_dirs）变化后，下次查找时强制重新扫描
+        self.rescan_requested = False
+        self.scan_task: Optional[asyncio.Task] = None
+
+    SCAN_SETTINGS = ("java_executables", "keywords", "ignore_dirs")
+
+    def on_config_changed(self, config, old_config):
+        if any(config.get(key) != old_config.get(key) for key in self.SCAN_SETTINGS):
+            logger.info("Java 扫描设置已变化，下次启动时将重新扫描")
+            self.rescan_requested = True
+
+    def load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            # 兼容曾短暂使用过的 {"last_full_scan", "runtimes"} 格式
+            if isinstance(data, dict):
+                data = data["runtimes"]
+            self._entries = {entry["path"]: entry for entry in data}
+            logger.debug("已加载 Java 清单: %s 条记录", len(self._entries))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"读取 Java 清单失败，将重新扫描: {str(e)}")
+            self._entries = {}
+
+    def revalidate(self) -> List[tuple]:
+        # 删除已不存在的运行时，返回可执行文件 mtime 变化（升级过）需要重新探测的 (目录, 可执行文件)
+        changed = []
+        for java_dir, entry in list(self._entries.items()):
+            try:
+                mtime = os.stat(entry["executable"]).st_mtime
+            except OSError:
+                del self._entries[java_dir]
+                self._dirty = True
+                continue
+            if mtime != entry["mtime"]:
+                changed.append((java_dir, entry["executable"]))
+        return changed
+
+    def is_known(self, java_dir) -> bool:
+        return java_dir in self._entries
+
+    def update(self, java_dir, executable, info):
+        try:
+            mtime = os.stat(executable).st_mtime
+        except OSError:
+            return
+        self._entries[java_dir] = {"path": java_dir, "executable": executable, "mtime": mtime, **info}
+        self._dirty = True
+
+    def has_suitable(self, required_version=None) -> bool:
+        majors = [entry.get("major") for entry in self._entries.values() if entry.get("major")]
+        if required_version is None:
+            return bool(majors)
+        return int(required_version) in majors
+
+    def start_scan(self, coro) -> asyncio.Task:
+        # 同一时间只运行一个全盘扫描；后台任务的异常在完成时记录，不会无人处理
+        if self.scan_task is None or self.scan_task.done():
+            self.rescan_requested = False
+            self.scan_task = asyncio.create_task(coro)
+            self.scan_task.add_done_callback(self._scan_finished)
+        else:
+            coro.close()
+        return self.scan_task
+
+    @staticmethod
+    def _scan_finished(task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"扫描 Java 失败: {task.exception()}")
+
+    def version_map(self) -> Dict[str, str]:
+        return {java_dir: entry["version"] for java_dir, entry in self._entries.items()}
+
+    def save(self):
+        if not self._dirty:
+            return
+        self._dirty = False
+        ensure_dir_exists(os.path.dirname(self.cache_file) or ".")
+        try:
+            with open(self.cache_file, "w", encoding="utf-8") as f:
+                json.dump(list(self._entries.values()), f, indent=4, ensure_ascii=False)
+        except OSError as e:
+            logger.warning(f"写入 Java 清单失败: {str(e)}")
+
+
+java_inventory = JavaInventory()
+
 
 async def read_json_file(path: str):
     async with aiofiles.open(path, "r", encoding="utf-8") as f: